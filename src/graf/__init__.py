@@ -15,29 +15,41 @@ text file.  So, to parse the annotations we must first construct the
 GrAF representation of the file, and then retrieve the annotations.
 """
 
-from graf.media import Region
-from graf.annotations import Annotation, AnnotationSpace, FeatureStructure
-from graf.graphs import Edge, Graph, Node, Link, GraphHeader, StandoffHeader, \
-    FileDesc, ProfileDesc, DataDesc, RevisonDesc
-from graf.io import GraphParser, GrafRenderer, StandoffHeaderRenderer
+from graf.media import PrimaryData, Region
+from graf.annotations import Annotation, AnnotationSpace, FeatureStructure, \
+    FeaturePath, FrozenFeatureStructure
+from graf.graphs import Edge, Graph, GraphView, Node, Link, GraphHeader, \
+    StandoffHeader, FileDesc, ProfileDesc, DataDesc, RevisonDesc
+from graf.io import GraphParser, GrafRenderer, StandoffHeaderRenderer, \
+    StandoffHeaderParser, FileSource, ZipSource, TarSource
+from graf.render import LayeredRenderer
 from graf.util import *
 
 __all__ = [
     'Annotation',
     'AnnotationSpace',
     'Edge',
+    'FeaturePath',
     'FeatureStructure',
+    'FileSource',
+    'FrozenFeatureStructure',
     'GrafRenderer',
     'Graph'
     'GraphParser',
     'GraphHeader',
+    'GraphView',
+    'LayeredRenderer',
     'Link',
     'Node',
+    'PrimaryData',
     'Region',
     'StandoffHeader',
     'FileDesc',
     'ProfileDesc',
     'DataDesc',
     'RevisonDesc',
+    'StandoffHeaderParser',
     'StandoffHeaderRenderer',
+    'TarSource',
+    'ZipSource',
 ]
@@ -0,0 +1,196 @@
+# graf-python: Python GrAF API
+#
+# Copyright (C) 2014 American National Corpus
+# Author: Keith Suderman <suderman@cs.vassar.edu> (Original API)
+#         Stephen Matysik <smatysik@gmail.com> (Conversion to Python)
+# URL: <http://www.anc.org/>
+# For license information, see LICENSE.TXT
+#
+
+"""
+asyncio support for loading GrAF documents. Kept apart from graf.io,
+which must stay importable on Python versions without coroutines; use
+L{GraphParser.parse_async} rather than this module directly.
+"""
+
+import asyncio
+import os
+
+from xml.sax import make_parser
+from xml.sax.handler import ContentHandler
+
+from graf.graphs import Graph
+from graf.io import CHUNK_SIZE, DocumentHeader, split_compression_ext
+
+
+class _HeaderEnd(Exception):
+    pass
+
+
+class DependencyScanner(ContentHandler):
+    """
+    Collects the dependencies declared in the graphHeader of an annotation
+    file and stops the parse as soon as the header is over.
+    """
+
+    def __init__(self, constants):
+        ContentHandler.__init__(self)
+        self._g = constants
+        self.dependencies = []
+
+    def startElement(self, name, attrs):
+        if name == self._g.DEPENDS_ON:
+            try:
+                self.dependencies.append(attrs[self._g.TYPE_F_ID])
+            except KeyError:
+                self.dependencies.append(attrs[self._g.TYPE])
+        elif name in (self._g.NODE, self._g.EDGE, self._g.REGION,
+                      self._g.ANNOTATION):
+            raise _HeaderEnd()
+
+    def endElement(self, name):
+        if name == self._g.HEADER:
+            raise _HeaderEnd()
+
+
+def scan_dependencies(data, constants):
+    """Returns the names of the dependencies declared in the header of the
+    given annotation file contents."""
+    parser = make_parser()
+    scanner = DependencyScanner(constants)
+    parser.setContentHandler(scanner)
+    try:
+        for i in range(0, len(data), CHUNK_SIZE):
+            parser.feed(data[i:i + CHUNK_SIZE])
+        parser.close()
+    except _HeaderEnd:
+        pass
+    return scanner.dependencies
+
+
+def _read(open_stream):
+    stream = open_stream()
+    try:
+        return stream.read()
+    finally:
+        stream.close()
+
+
+def _feed(parser, data):
+    for i in range(0, len(data), CHUNK_SIZE):
+        parser.feed(data[i:i + CHUNK_SIZE])
+    parser.close()
+
+
+async def parse_async(gparser, stream, graph=None, executor=None):
+    """Coroutine implementing L{GraphParser.parse_async}.
+
+    All files (the header, its annotation files and, recursively, their
+    dependencies) are read concurrently before the graph is built, in the
+    same order as L{GraphParser.parse} would build it. The files are then
+    parsed one after the other in the executor, so that a dependency
+    declared where it was not found by L{scan_dependencies} is read there
+    too rather than on the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    source = gparser._source
+
+    async def fetch(open_stream):
+        return await loop.run_in_executor(executor, _read, open_stream)
+
+    deps = {}
+
+    async def fetch_dependency(name):
+        data = await fetch(lambda: get_dependency(name))
+        await fetch_dependencies(data)
+        return data
+
+    async def fetch_dependencies(data):
+        names = [name for name in scan_dependencies(data, gparser._g)
+                 if name not in deps]
+        for name in names:
+            deps[name] = asyncio.ensure_future(fetch_dependency(name))
+        await asyncio.gather(*[deps[name] for name in names])
+
+    async def fetch_layer(path):
+        data = await fetch(lambda: source.open(path))
+        await fetch_dependencies(data)
+        return data
+
+    def parse_dependency(name, graph):
+        if name in parsed_deps:
+            return
+        parsed_deps.add(name)
+        if name in parsed_layers:
+            return
+        try:
+            data = fetched[name]
+        except KeyError:
+            # Runs in the executor, like the parse
+            data = _read(lambda: get_dependency(name))
+        _feed(gparser._create_sax_parser(graph, parse_dependency, name), data)
+
+    if hasattr(stream, 'read'):
+        filename = stream.name
+        data = await loop.run_in_executor(executor, stream.read)
+    else:
+        filename = stream
+        data = await fetch(lambda: source.open(filename))
+
+    parsed_deps = set()
+    parsed_layers = set()
+    extension = os.path.splitext(split_compression_ext(filename)[0])[1][1:]
+
+    if extension == 'hdr':
+        if gparser._validate:
+            gparser.graf_validator.validate_xml(data, header=True)
+        header = DocumentHeader(filename).load(data)
+        primary_loc, header_annotations = header.primary_data_loc, header.annotations
+        dirname = source.dirname(filename)
+        paths = [source.join(dirname, loc) for fid, loc in header_annotations]
+        locate = gparser._dependency_locator(filename, header)
+    else:
+        header_annotations = [(None, filename)]
+        paths = [filename]
+        locate = gparser._dependency_locator(filename)
+
+    if gparser._get_dep:
+        get_dependency = gparser._get_dep
+    else:
+        def get_dependency(name):
+            return source.open(locate(name))
+
+    if extension == 'hdr':
+        layers = await asyncio.gather(*[fetch_layer(path) for path in paths])
+    else:
+        await fetch_dependencies(data)
+        layers = [data]
+
+    # Dependencies may still be in flight if they were first requested by
+    # a layer that finished earlier
+    pending = [task for task in deps.values() if not task.done()]
+    while pending:
+        await asyncio.gather(*pending)
+        pending = [task for task in deps.values() if not task.done()]
+    fetched = dict((name, task.result()) for name, task in deps.items())
+
+    for (fid, loc), layer in zip(header_annotations, layers):
+        if fid in parsed_deps:
+            continue
+        # Not parsed again when another layer depends on it
+        if fid is not None:
+            parsed_layers.add(fid)
+
+        if graph is None:
+            graph = Graph()
+
+        parser = gparser._create_sax_parser(graph, parse_dependency, fid)
+        await loop.run_in_executor(executor, _feed, parser, layer)
+
+    if (extension == 'hdr' and graph is not None and
+            graph.primary_data is None):
+        graph.primary_data = gparser._primary_data(filename, primary_loc)
+
+    gparser._parsed_deps = parsed_deps
+
+    return graph
@@ -16,7 +16,7 @@ class Annotation(object):
     provides convenience methods for setting and getting values
     from a feature structure.
     """
-    __slots__ = ('id', 'label', 'features', 'aspace', 'element')
+    __slots__ = ('id', 'label', '_features', '_raw_features', 'aspace', 'element')
     _ninsts = -1
 
     def __init__(self, label, features=None, id=None):
@@ -29,12 +29,39 @@ class Annotation(object):
 
         self.id = id if id is not None else self._next_id()
         self.label = label
-        if not isinstance(features, FeatureStructure):
+        if features is not None and not isinstance(features, FeatureStructure):
             features = FeatureStructure(items=features)
-        self.features = features
+        # Without features, the empty FeatureStructure is only created
+        # when the features are first accessed
+        self._features = features
+        self._raw_features = None
         self.aspace = None
         self.element = None
 
+    @classmethod
+    def from_record(cls, label, record, id=None):
+        """Creates an annotation whose features are given as a record (see
+        L{FeatureStructure.from_record}) and only expanded into a
+        C{FeatureStructure} when L{features} is first accessed."""
+        res = cls(label, id=id)
+        res._raw_features = record
+        return res
+
+    @property
+    def features(self):
+        if self._features is None:
+            if self._raw_features is None:
+                self._features = FeatureStructure()
+            else:
+                self._features = FeatureStructure.from_record(self._raw_features)
+                self._raw_features = None
+        return self._features
+
+    @features.setter
+    def features(self, features):
+        self._features = features
+        self._raw_features = None
+
     @classmethod
     def _next_id(cls):
         cls._ninsts += 1
@@ -43,8 +70,11 @@ class Annotation(object):
     def __repr__(self):
         return "Annotation(%r, %r)" % (self.label, self.id)
 
-    def __eq__(self, id):
-        return self.id == id
+    def __eq__(self, other):
+        return isinstance(other, Annotation) and self.id == other.id
+
+    def __ne__(self, other):
+        return not self == other
 
     #TODO: perhaps delegate __*item__, etc. methods to features
 
@@ -52,21 +82,65 @@ class Annotation(object):
 class AnnotationList(object):
     """
     A collection of Annotations which marks a field on the annotation object indicating its possession.
+
+    Annotations are removed in constant time: their slot is cleared and
+    the list is compacted once more than half of it is empty.
     """
-    __slots__ = ('_elements', '_set_owner')
+    __slots__ = ('_elements', '_owner', '_owner_field', '_positions', '_holes')
+
+    # Lists shorter than this are never compacted
+    MIN_COMPACT = 32
 
     def __init__(self, owned_by, owner_field):
         self._elements = []
-        self._set_owner = lambda ann: setattr(ann, owner_field, owned_by)
+        self._owner = owned_by
+        self._owner_field = owner_field
+        # id() of each annotation -> its index in _elements
+        self._positions = {}
+        self._holes = 0
+
+    def __getstate__(self):
+        self._compact()
+        return self._elements, self._owner, self._owner_field
+
+    def __setstate__(self, state):
+        self._elements, self._owner, self._owner_field = state
+        self._reindex()
+
+    def _set_owner(self, ann):
+        setattr(ann, self._owner_field, self._owner)
+
+    def _reindex(self):
+        self._positions = dict((id(ann), i) for i, ann in enumerate(self._elements))
+        self._holes = 0
+
+    def _compact(self):
+        if self._holes:
+            self._elements = [ann for ann in self._elements if ann is not None]
+            self._reindex()
+
+    def _discard(self, ann):
+        """Removes ann from this list only, returning False if it is absent"""
+        i = self._positions.pop(id(ann), None)
+        if i is None:
+            return False
+        self._elements[i] = None
+        self._holes += 1
+        if self._holes > self.MIN_COMPACT and 2 * self._holes > len(self._elements):
+            self._compact()
+        return True
 
     def __len__(self):
-        return len(self._elements)
+        return len(self._elements) - self._holes
 
     def __iter__(self):
-        return iter(self._elements)
+        return (ann for ann in self._elements if ann is not None)
+
+    def __contains__(self, ann):
+        return id(ann) in self._positions
 
     def __repr__(self):
-        return repr(self._elements)
+        return repr(list(self))
 
     def add(self, ann):
         """Adds a C{Annotation} to this C{AnnotationSpace}.
@@ -74,6 +148,13 @@ class AnnotationList(object):
         """
 
         #if ann not in self._elements:
+        if id(ann) in self._positions:
+            return
+        # An annotation belongs to one element and one annotation space
+        previous = _owner_list(ann, self._owner_field)
+        if previous is not None:
+            previous._discard(ann)
+        self._positions[id(ann)] = len(self._elements)
         self._elements.append(ann)
         self._set_owner(ann)
 
@@ -89,6 +170,36 @@ class AnnotationList(object):
         self.add(ann)
         return ann
 
+    def remove(self, ann):
+        """Removes the given C{Annotation} from this list, and from the
+        element or annotation space it also belongs to.
+
+        :param ann: Annotation
+        """
+        if ann not in self:
+            raise ValueError('Annotation not in list: %r' % ann)
+        self._remove(ann)
+
+    def remove_all(self, anns):
+        """Removes the given C{Annotation} objects, as L{remove} does, in
+        time linear in their number.
+
+        :param anns: iterable of Annotation
+        """
+        for ann in list(anns):
+            if ann in self:
+                self._remove(ann)
+
+    def _remove(self, ann):
+        self._discard(ann)
+        if getattr(ann, self._owner_field) is self._owner:
+            setattr(ann, self._owner_field, None)
+        other = 'element' if self._owner_field == 'aspace' else 'aspace'
+        owner = _owner_list(ann, other)
+        if owner is not None:
+            owner._discard(ann)
+            setattr(ann, other, None)
+
     def select(self, label=None, fs=None, aspace=None):
         """Generates Annotation objects having the given label and features
         subsumed by the given FeatureStructure.
@@ -104,14 +215,14 @@ class AnnotationList(object):
         gen : generator of Annotation
         """
         filters = self._build_filters(label, fs, aspace)
-        return (ann for ann in self._elements if all(fn(ann) for fn in filters))
+        return (ann for ann in self if all(fn(ann) for fn in filters))
 
     def select_not(self, label=None, fs=None, aspace=None):
         """
         Generates those annotations that would not be returned by select() with the same arguments.
         """
         filters = self._build_filters(label, fs, aspace)
-        return (ann for ann in self._elements if not all(fn(ann) for fn in filters))
+        return (ann for ann in self if not all(fn(ann) for fn in filters))
 
     @staticmethod
     def _build_filters(label=None, fs=None, aspace=None):
@@ -151,19 +262,31 @@ class AnnotationSpace(AnnotationList):
 
     def __copy__(self):
         res = AnnotationSpace(self.as_id)
-        res.annotations = self.annotations[:]
+        res._elements = list(self)
+        res._reindex()
         return res
 
     def __repr__(self):
         return "AnnotationSpace(%r)" % (self.as_id)
 
+    def __getstate__(self):
+        self._compact()
+        return self.as_id, self._elements
+
+    def __setstate__(self, state):
+        self.as_id, self._elements = state
+        self._owner = self
+        self._owner_field = 'aspace'
+        self._reindex()
+
     def remove(self, ann):
-        """Remove the given C{Annotation} object.
+        """Remove the given C{Annotation} object from this space and from
+        the annotations of its element.
 
         :param a: Annotation
         """
         try:
-            return self._elements.remove(ann)
+            AnnotationList.remove(self, ann)
         except ValueError:
             print('Error: Annotation not in set')
 
@@ -174,7 +297,16 @@ class AnnotationSpace(AnnotationList):
         :param label: C{str}
         :param fs: C{FeatureStructure}
         """
-        self._elements = list(self.select_not(label, fs))
+        self.remove_all(list(self.select(label, fs)))
+
+
+def _owner_list(ann, field):
+    """Returns the C{AnnotationList} of the annotation's owner in the given
+    field ('aspace' or 'element'), or None if it has none"""
+    owner = getattr(ann, field)
+    if owner is None or field == 'aspace':
+        return owner
+    return owner.annotations
 
 
 class FeatureStructure(object):
@@ -185,7 +317,9 @@ class FeatureStructure(object):
     Additionally, a FeatureStructure defines the operations 'subsumes' and 'unify'.
     """
 
-    __slots__ = ('type', '_elements')
+    # _borrowed: names of the nested structures shared with other feature
+    # structures, copied when first written through a path (or None)
+    __slots__ = ('type', '_elements', '_borrowed')
 
     def __init__(self, type_var=None, items=None):
         """Constructor for C{FeatureStructure}.
@@ -195,6 +329,7 @@ class FeatureStructure(object):
         """
         self.type = type_var
         self._elements = {}
+        self._borrowed = None
         if items:
             self.update(items)
 
@@ -204,6 +339,21 @@ class FeatureStructure(object):
     def __repr__(self):
         return "<FeatureStructure(%r) with %d elements>" % (self.type, len(self))
 
+    @classmethod
+    def from_record(cls, record):
+        """Builds a feature structure from its compact record form, a
+        (type, items) tuple where items is a tuple of (name, value) pairs
+        and each value is a string, None, or a nested record. Items are
+        set in order, as when parsing, so later ones override earlier ones.
+        """
+        type_, items = record
+        res = cls(type_)
+        for name, value in items:
+            if isinstance(value, tuple):
+                value = cls.from_record(value)
+            res[name] = value
+        return res
+
     def __copy__(self):
         res = FeatureStructure(self.type)
         res._elements = self._elements.copy()
@@ -211,9 +361,17 @@ class FeatureStructure(object):
 
     copy = __copy__
 
-    def __deepcopy__(self):
+    def __getstate__(self):
+        return self.type, self._elements
+
+    def __setstate__(self, state):
+        self.type, self._elements = state
+        self._borrowed = None
+
+    def __deepcopy__(self, memo):
         res = FeatureStructure(self.type)
-        res._elements = copy.deepcopy(self._elements)
+        memo[id(self)] = res
+        res._elements = copy.deepcopy(self._elements, memo)
         return res
 
     def __iter__(self):
@@ -239,32 +397,77 @@ class FeatureStructure(object):
     def items(self):
         return self._elements.items()
 
-    def _resolve_fs(self, path, create=False):
+    def _resolve_fs(self, path, create=False, thaw=False):
         """
         Resolves a list of keys to this or a descendent feature structure.
+        With thaw, the frozen structures on the path are replaced by mutable
+        copies, so that the result can be modified without changing them.
         """
         fs = self
         for name in path:
+            parent = fs
             try:
                 fs = fs._elements[name]
             except KeyError:
                 if create:
-                    fs = fs._elements[name] = FeatureStructure()
+                    fs._elements[name] = new_fs = FeatureStructure()
+                    fs = new_fs
                 else:
                     fs = None
             if not isinstance(fs, FeatureStructure):
                 raise KeyError('Could not resolve feature structure for path %r. Got %r' % (path, fs))
+            if thaw and (isinstance(fs, FrozenFeatureStructure) or
+                         parent._borrowed and name in parent._borrowed):
+                # Frozen structures may be shared through a pool, and
+                # borrowed ones by the inputs of a unification
+                parent._elements[name] = fs = fs._cow_copy()
+                if parent._borrowed:
+                    parent._borrowed.discard(name)
         return fs
 
-    def _parse_key(self, key, create=False):
-        try:
-            key = key.strip('/').split('/')
-        except AttributeError:
-            # assume key is already list of path elements
-            pass
-        return self._resolve_fs(key[:-1], create), key[-1]
+    def _cow_copy(self):
+        """Returns a mutable shallow copy, whose nested structures are
+        borrowed from this one"""
+        res = FeatureStructure(self.type)
+        res._elements = self._elements.copy()
+        res._borrow()
+        return res
+
+    def _borrow(self):
+        self._borrowed = set(
+            name for name, value in self._elements.items()
+            if isinstance(value, FeatureStructure) and
+            not isinstance(value, FrozenFeatureStructure)) or None
+
+    def _set_element(self, key, val):
+        self._elements[key] = val
+        if self._borrowed:
+            self._borrowed.discard(key)
+
+    def _parse_key(self, key, create=False, thaw=False):
+        key = _split_key(key)
+        if len(key) == 1:
+            return self, key[0]
+        return self._resolve_fs(key[:-1], create, thaw), key[-1]
+
+    @staticmethod
+    def path(key):
+        """Returns a reusable L{FeaturePath} for the given key, which looks
+        up the feature in any feature structure without parsing the key
+        again.
+
+        :param key: C{str} of names joined by '/', or C{tuple} of names
+        :return: FeaturePath
+        """
+        return FeaturePath(key)
 
     def __contains__(self, key):
+        try:
+            # Plain keys are found without parsing them
+            if key in self._elements:
+                return True
+        except TypeError:
+            pass
         try:
             fs, key = self._parse_key(key)
         except KeyError:
@@ -272,6 +475,11 @@ class FeatureStructure(object):
         return key in fs._elements
 
     def __getitem__(self, key):
+        try:
+            # Plain keys are found without parsing them
+            return self._elements[key]
+        except (KeyError, TypeError):
+            pass
         fs, key = self._parse_key(key)
         return fs._elements[key]
 
@@ -296,11 +504,15 @@ class FeatureStructure(object):
         return val
 
     def __setitem__(self, key, val):
-        fs, key = self._parse_key(key, create=True)
-        fs._elements[key] = val
+        fs, key = self._parse_key(key, create=True, thaw=True)
+        fs._set_element(key, val)
 
     def setdefault(self, key, default):
-        fs, key = self._parse_key(key, create=True)
+        try:
+            return self[key]
+        except KeyError:
+            pass
+        fs, key = self._parse_key(key, create=True, thaw=True)
         return fs._elements.setdefault(key, default)
 
     def update(self, other):
@@ -310,31 +522,46 @@ class FeatureStructure(object):
             self[key] = value
 
     def __delitem__(self, key):
-        fs, key = self._parse_key(key)
+        if key not in self:
+            raise KeyError(key)
+        fs, key = self._parse_key(key, thaw=True)
         del fs._elements[key]
+        if fs._borrowed:
+            fs._borrowed.discard(key)
 
     def pop(self, key, default=None):
-        try:
-            fs, key = self._parse_key(key)
-            return fs._elements.pop(key, default)
-        except KeyError:
+        if key not in self:
             return default
+        fs, key = self._parse_key(key, thaw=True)
+        if fs._borrowed:
+            fs._borrowed.discard(key)
+        return fs._elements.pop(key)
 
     def __eq__(self, other):
         """
         Equivalence is equivalent types (????)
+        A frozen structure is only equal to one with the same features.
         """
+        if isinstance(other, FrozenFeatureStructure):
+            return other == self
         try:
             return self.type == other.type
         except AttributeError:
             return False
 
+    def __ne__(self, other):
+        return not self == other
+
     def subsumes(self, other):
+        if self is other:
+            return True
         for key, val in self.items():
             try:
                 oval = other._elements[key]
             except KeyError:
                 return False
+            if val is oval:
+                continue
             if isinstance(val, FeatureStructure) and isinstance(oval, FeatureStructure):
                 if not val.subsumes(oval):
                     return False
@@ -343,19 +570,252 @@ class FeatureStructure(object):
         return True
 
     def unify(self, other):
+        """Returns the unification of this feature structure with other,
+        or raises a ValueError if they conflict. Neither input is modified.
+
+        Only the feature structures on the path to a difference are built:
+        the nested structures that only occur in, or are identical in, one
+        of the inputs are shared with the result, and copied when they are
+        first written through a path of the result (e.g. res['agr/num']).
+        Modifying them in place, as in res['agr'].update(...), changes the
+        inputs too.
+
+        :return: FeatureStructure
+        """
+        res = self._unify(other, {})
+        if res is self:
+            # The result itself is never shared
+            res = res._cow_copy()
+        return res
+
+    def _unify(self, other, memo):
+        if self is other:
+            return self
+        key = (id(self), id(other))
+        try:
+            return memo[key][2]
+        except KeyError:
+            pass
+
         if self.type != other.type and self.type is not None and other.type is not None:
             raise ValueError('Cannot unify feature structues of different types: %r and %r' % (self.type, other.type))
 
-        res = copy.deepcopy(self)
+        res = FeatureStructure(self.type if self.type is not None else other.type)
+        elements = res._elements = self._elements.copy()
 
-        for name, oval in other.items():
-            if name not in res._elements:
-                res._elements[name] = copy.deepcopy(oval)
+        for name, oval in other._elements.items():
+            try:
+                val = elements[name]
+            except KeyError:
+                elements[name] = oval
                 continue
 
-            val = res._elements[name]
+            if val is oval:
+                continue
             if isinstance(val, FeatureStructure) and isinstance(oval, FeatureStructure):
-                res._elements[name] = val.unify(oval)
+                elements[name] = val._unify(oval, memo)
             elif val != oval:
                 raise ValueError('Name %r exists but value %r != %r in unification' % (name, val, oval))
+
+        # Every nested structure may be shared, by the inputs or by other
+        # results of unify_all
+        res._borrow()
+        # The inputs are kept so that their ids are not reused in the batch
+        memo[key] = (self, other, res)
+        return res
+
+    def freeze(self, pool=None):
+        """Returns an immutable, hashable L{FrozenFeatureStructure} with the
+        same features.
+
+        :param pool: C{dict} in which identical frozen structures are
+            shared, nested ones included. Structures frozen with the same
+            pool are identical objects whenever they are equal.
+        :return: FrozenFeatureStructure
+        """
+        return FrozenFeatureStructure._from_fs(self, pool)
+
+    def thaw(self):
+        """Returns a mutable copy of this feature structure, in which nested
+        frozen structures are thawed too"""
+        res = FeatureStructure(self.type)
+        for name, value in self._elements.items():
+            if isinstance(value, FrozenFeatureStructure):
+                value = value.thaw()
+            res._elements[name] = value
+        return res
+
+    @staticmethod
+    def unify_all(pairs, strict=True):
+        """Unifies each (fs, other) pair, like fs.unify(other).
+
+        Pairs of nested structures occurring in several of the given pairs
+        are unified only once, and the results share them until they are
+        written through, as in L{unify}.
+
+        Parameters
+        ----------
+        pairs : iterable of (FeatureStructure, FeatureStructure)
+        strict : bool, optional
+            Whether to raise a ValueError on the first conflicting pair.
+            Otherwise None is returned for conflicting pairs.
+
+        Returns
+        -------
+        res : list of FeatureStructure
+
+        """
+        memo = {}
+        res = []
+        for fs, other in pairs:
+            try:
+                res.append(fs._unify(other, memo)._cow_copy())
+            except ValueError:
+                if strict:
+                    raise
+                res.append(None)
         return res
+
+
+class FrozenFeatureStructure(FeatureStructure):
+    """
+    An immutable and hashable C{FeatureStructure}. Frozen structures are
+    equal when their types and features are, so identical ones can be
+    shared through a pool (see L{FeatureStructure.freeze}). Use
+    L{FeatureStructure.thaw} to get a mutable copy.
+    """
+
+    __slots__ = ('_hash',)
+
+    def __init__(self, type_var=None, items=None):
+        """Constructor for C{FrozenFeatureStructure}.
+
+        :param type: C{str}
+        :param items: features, as for C{FeatureStructure}
+
+        """
+        fs = FeatureStructure(type_var, items)
+        self._set(fs.type, dict(
+            (name, value.freeze() if isinstance(value, FeatureStructure) else value)
+            for name, value in fs._elements.items()))
+
+    @classmethod
+    def _from_fs(cls, fs, pool):
+        if not isinstance(fs, FrozenFeatureStructure):
+            elements = {}
+            for name, value in fs._elements.items():
+                if isinstance(value, FeatureStructure):
+                    value = cls._from_fs(value, pool)
+                elements[name] = value
+            frozen = cls.__new__(cls)
+            frozen._set(fs.type, elements)
+            fs = frozen
+        if pool is not None:
+            fs = pool.setdefault(fs, fs)
+        return fs
+
+    def _set(self, type_, elements):
+        object.__setattr__(self, 'type', type_)
+        object.__setattr__(self, '_elements', elements)
+        object.__setattr__(self, '_hash', None)
+        object.__setattr__(self, '_borrowed', None)
+
+    def __repr__(self):
+        return "<FrozenFeatureStructure(%r) with %d elements>" % (self.type, len(self))
+
+    @classmethod
+    def from_record(cls, record):
+        return FeatureStructure.from_record(record).freeze()
+
+    def __setstate__(self, state):
+        self._set(*state)
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __hash__(self):
+        if self._hash is None:
+            object.__setattr__(self, '_hash', hash(
+                (self.type, frozenset(self._elements.items()))))
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, FeatureStructure):
+            return False
+        if not isinstance(other, FrozenFeatureStructure):
+            # Mutable structures are compared by content too, both ways
+            other = other.freeze()
+        return (hash(self) == hash(other) and self.type == other.type
+                and self._elements == other._elements)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def freeze(self, pool=None):
+        if pool is None:
+            return self
+        return pool.setdefault(self, self)
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('FrozenFeatureStructure is immutable')
+
+    __setattr__ = __setitem__ = __delitem__ = setdefault = update = pop = _immutable
+
+
+# Cache of the names in the path keys used so far
+_path_cache = {}
+_PATH_CACHE_SIZE = 10000
+
+
+def _split_key(key):
+    """Returns the tuple of names in a key given as a string of names
+    joined by '/' or as a sequence of names"""
+    try:
+        return _path_cache[key]
+    except KeyError:
+        pass
+    except TypeError:
+        # lists are not hashable
+        return tuple(key)
+    try:
+        names = tuple(key.strip('/').split('/'))
+    except AttributeError:
+        # assume key is already list of path elements
+        names = tuple(key)
+    if len(_path_cache) >= _PATH_CACHE_SIZE:
+        _path_cache.clear()
+    _path_cache[key] = names
+    return names
+
+
+class FeaturePath(object):
+    """
+    A precompiled key of a (possibly nested) feature. Calling it with a
+    C{FeatureStructure} returns the value of the feature, like indexing the
+    feature structure with the key, without parsing the key each time.
+    """
+
+    __slots__ = ('names', '_parents', '_name')
+
+    def __init__(self, key):
+        self.names = _split_key(key)
+        self._parents = self.names[:-1]
+        self._name = self.names[-1]
+
+    def __repr__(self):
+        return "FeaturePath(%r)" % '/'.join(self.names)
+
+    def __call__(self, fs):
+        for name in self._parents:
+            fs = fs._elements[name]
+            if not isinstance(fs, FeatureStructure):
+                raise KeyError('Could not resolve feature structure for path %r. Got %r' % (self.names, fs))
+        return fs._elements[self._name]
+
+    def get(self, fs, default=None):
+        try:
+            return self(fs)
+        except KeyError:
+            return default
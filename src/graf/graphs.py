@@ -16,8 +16,63 @@ larger graphs as needed.
 """
 
 import sys
+from collections import deque
 
-from graf.annotations import FeatureStructure, AnnotationList, AnnotationSpace
+from graf.annotations import Annotation, FeatureStructure, AnnotationList, \
+    AnnotationSpace
+from graf.media import Region
+
+# Attributes of graph elements that are restored from the graph structure
+# when unpickling a Graph, rather than pickled as they are
+_STRUCTURE_FIELDS = frozenset(('id', 'visited', 'annotations', 'in_edges',
+                               'out_edges', 'links', 'from_node', 'to_node',
+                               'pos', '_span'))
+
+
+def _element_extras(element):
+    """Returns the attributes of a graph element that are not part of the
+    graph structure (e.g. is_root), or None"""
+    extras = dict((key, val) for key, val in element.__dict__.items()
+                  if key not in _STRUCTURE_FIELDS)
+    return extras or None
+
+
+def _link_span(node):
+    """Returns the (start, end) anchors of the regions linked to a node"""
+    anchors = [anchor for link in node.links for region in link
+               for anchor in region.anchors]
+    if not anchors:
+        return None
+    return min(anchors), max(anchors)
+
+
+def _union_span(spans):
+    """Returns the (start, end) pair covering all the given spans"""
+    spans = [span for span in spans if span]
+    if not spans:
+        return None
+    return min(span[0] for span in spans), max(span[1] for span in spans)
+
+
+def _compute_spans(node):
+    """Computes and caches the spans of the given node and all its
+    descendants that have none cached, children before parents."""
+    in_progress = set()
+    stack = [(node, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            node._span = _union_span(
+                child._span for child in node.iter_children()) or ()
+        elif node._span is None and id(node) not in in_progress:
+            if node.links:
+                node._span = _link_span(node) or ()
+                continue
+            # Nodes in progress are skipped, which cuts cycles
+            in_progress.add(id(node))
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.iter_children()
+                         if child._span is None)
 
 
 class IdDict(dict):
@@ -41,12 +96,61 @@ class IdDict(dict):
 
 
 class GraphEdges(IdDict):
-    __slots__ = ()
+    __slots__ = ('_adjacency',)
+
+    def __init__(self, data=()):
+        IdDict.__init__(self, data)
+        # (from node id, to node id) -> list of edges, in insertion order
+        self._adjacency = {}
 
     def add(self, obj):
         IdDict.add(self, obj)
         obj.from_node.out_edges.add(obj)
         obj.to_node.in_edges.add(obj)
+        obj.from_node.invalidate_span()
+        key = (obj.from_node.id, obj.to_node.id)
+        try:
+            self._adjacency[key].append(obj)
+        except KeyError:
+            self._adjacency[key] = [obj]
+
+    def between(self, from_id, to_id):
+        """Returns the list of edges from the node with id from_id to the
+        node with id to_id, in the order they were added."""
+        return self._adjacency.get((from_id, to_id), [])
+
+    def remove(self, obj):
+        """Removes the given edge from the graph and from the edge lists of
+        its nodes"""
+        del self[obj.id]
+        obj.from_node.invalidate_span()
+        obj.from_node.out_edges.remove(obj)
+        obj.to_node.in_edges.remove(obj)
+        key = (obj.from_node.id, obj.to_node.id)
+        parallel = self._adjacency[key]
+        if len(parallel) == 1:
+            del self._adjacency[key]
+        else:
+            parallel[:] = [edge for edge in parallel if edge is not obj]
+
+    def remove_all(self, edges):
+        """Removes the given edges at once, filtering the parallel edges
+        between each pair of nodes a single time"""
+        edges = dict((id(edge), edge) for edge in edges)
+        for edge in edges.values():
+            del self[edge.id]
+            edge.from_node.invalidate_span()
+            edge.from_node.out_edges.remove(edge)
+            edge.to_node.in_edges.remove(edge)
+        keys = set((edge.from_node.id, edge.to_node.id)
+                   for edge in edges.values())
+        for key in keys:
+            parallel = [edge for edge in self._adjacency[key]
+                        if id(edge) not in edges]
+            if parallel:
+                self._adjacency[key] = parallel
+            else:
+                del self._adjacency[key]
 
 
 class GraphNodes(IdDict):
@@ -102,6 +206,8 @@ class Graph(object):
         self.edges = GraphEdges()
         self.regions = IdDict()
         self.content = None
+        # graf.media.PrimaryData with the text the regions point into
+        self.primary_data = None
         self.header = GraphHeader()
         self.annotation_spaces = GraphASpaces(self.header.add_annotation_space)
 
@@ -109,6 +215,135 @@ class Graph(object):
         # to the graph source/origins
         self.additional_information = {}
 
+    # Pickling
+
+    def __getstate__(self):
+        """Flattens the graph into id-indexed arrays, so that pickling does
+        not recurse through the node -> edge -> node references.
+
+        Nodes, regions and annotations are referred to by their index in
+        the corresponding array. Nodes and regions that are only reachable
+        through edges or links are appended after those in the graph.
+        """
+        nodes = list(self.nodes)
+        node_ind = dict((id(node), i) for i, node in enumerate(nodes))
+        n_nodes = len(nodes)
+        for edge in self.edges:
+            for node in (edge.from_node, edge.to_node):
+                if id(node) not in node_ind:
+                    node_ind[id(node)] = len(nodes)
+                    nodes.append(node)
+
+        regions = list(self.regions)
+        region_ind = dict((id(region), i) for i, region in enumerate(regions))
+        n_regions = len(regions)
+        links = []
+        for node in nodes:
+            node_links = []
+            for link in node.links:
+                for region in link:
+                    if id(region) not in region_ind:
+                        region_ind[id(region)] = len(regions)
+                        regions.append(region)
+                node_links.append([region_ind[id(region)] for region in link])
+            links.append(node_links)
+
+        edges = list(self.edges)
+
+        annotations = []
+        ann_ind = {}
+        for kind, elements in ((0, nodes), (1, edges)):
+            for i, element in enumerate(elements):
+                for ann in element.annotations:
+                    ann_ind[id(ann)] = len(annotations)
+                    annotations.append((ann.label, ann.features, ann.id,
+                                        kind, i))
+        aspaces = []
+        for aspace in self.annotation_spaces:
+            indices = []
+            for ann in aspace:
+                if id(ann) not in ann_ind:
+                    ann_ind[id(ann)] = len(annotations)
+                    annotations.append((ann.label, ann.features, ann.id,
+                                        None, None))
+                indices.append(ann_ind[id(ann)])
+            aspaces.append((aspace.as_id, indices))
+
+        return {
+            'nodes': [(node.id, _element_extras(node)) for node in nodes],
+            'n_nodes': n_nodes,
+            'regions': [(region.id, region.anchors) for region in regions],
+            'n_regions': n_regions,
+            'links': links,
+            'edges': [(edge.id, node_ind[id(edge.from_node)],
+                       node_ind[id(edge.to_node)], edge.pos,
+                       _element_extras(edge)) for edge in edges],
+            'annotations': annotations,
+            'aspaces': aspaces,
+            'depends_on': self.header.depends_on,
+            'roots': self.header.roots,
+            'layers': self.header.layers,
+            'features': self.features,
+            'content': self.content,
+            'primary_data': self.primary_data,
+            'additional_information': self.additional_information,
+            'top_edge_id': self._top_edge_id,
+            'edge_pos': self._edge_pos,
+        }
+
+    def __setstate__(self, state):
+        """Rebuilds the graph and all its references from the arrays
+        produced by __getstate__."""
+        Graph.__init__(self)
+        self.features = state['features']
+        self.content = state['content']
+        self.primary_data = state['primary_data']
+        self.additional_information = state['additional_information']
+        self._top_edge_id = state['top_edge_id']
+        self._edge_pos = state['edge_pos']
+        self.header.depends_on = list(state['depends_on'])
+        self.header.roots = list(state['roots'])
+        self.header.layers = dict(state.get('layers', ()))
+
+        regions = []
+        for i, (id, anchors) in enumerate(state['regions']):
+            region = Region(id, *anchors)
+            regions.append(region)
+            if i < state['n_regions']:
+                self.regions.add(region)
+
+        nodes = []
+        for i, (id, extras) in enumerate(state['nodes']):
+            node = Node(id)
+            if extras:
+                node.__dict__.update(extras)
+            nodes.append(node)
+            if i < state['n_nodes']:
+                self.nodes.add(node)
+        for node, node_links in zip(nodes, state['links']):
+            for link in node_links:
+                node.add_link(Link(regions[i] for i in link))
+
+        edges = []
+        for id, from_ind, to_ind, pos, extras in state['edges']:
+            edge = Edge(id, nodes[from_ind], nodes[to_ind], pos)
+            if extras:
+                edge.__dict__.update(extras)
+            edges.append(edge)
+            self.edges.add(edge)
+
+        annotations = []
+        for label, features, id, kind, i in state['annotations']:
+            ann = Annotation(label, features, id)
+            annotations.append(ann)
+            if kind is not None:
+                (nodes, edges)[kind][i].annotations.add(ann)
+
+        for as_id, indices in state['aspaces']:
+            aspace = self.annotation_spaces.create(as_id)
+            for i in indices:
+                aspace.add(annotations[i])
+
     def create_edge(self, from_node, to_node, id=None):
         """Create graf.Edge from id, from_node, to_node and add it to
         this graf.Graph.
@@ -154,26 +389,29 @@ class Graph(object):
     def find_edge(self, from_node, to_node):
         """Search for C{Edge} with its from_node, to_node, either nodes or ids.
 
+        If several edges connect the nodes, the first one added is returned.
+
         :param from_node: C{Node} or C{str}
         :param to_node: C{Node} or C{str}
         :return: C{Edge} or None
         """
-        # resolve ids to nodes if necessary
-        if not isinstance(from_node, Node):
-            from_node = self.nodes[from_node]
-        if not isinstance(to_node, Node):
-            to_node = self.nodes[to_node]
-
-        if len(from_node.out_edges) < len(to_node.in_edges):
-            for edge in from_node.out_edges:
-                if edge.to_node == to_node:
-                    return edge
-        else:
-            for edge in to_node.in_edges:
-                if edge.from_node == from_node:
-                    return edge
+        edges = self.find_edges(from_node, to_node)
+        if edges:
+            return edges[0]
         return None
 
+    def find_edges(self, from_node, to_node):
+        """Returns all C{Edge}s from from_node to to_node, either nodes or
+        ids, in the order they were added.
+
+        :param from_node: C{Node} or C{str}
+        :param to_node: C{Node} or C{str}
+        :return: C{list} of C{Edge}
+        """
+        from_id = getattr(from_node, 'id', from_node)
+        to_id = getattr(to_node, 'id', to_node)
+        return list(self.edges.between(from_id, to_id))
+
     def get_element(self, id):
         if id in self.nodes:
             return self.nodes[id]
@@ -186,6 +424,123 @@ class Graph(object):
                 return region
         return None
 
+    # Removal. Removing an edge or an annotation takes constant time, and
+    # removing a node time proportional to the number of its edges and
+    # annotations, plus the number of nodes linked to each of its regions
+    # (region.nodes is a plain list), not to the size of the graph.
+
+    def remove_edge(self, edge):
+        """Removes the given C{Edge}, or the edge with the given id, from
+        this graph, along with its annotations.
+
+        :param edge: C{Edge} or C{str}
+        """
+        if not isinstance(edge, Edge):
+            edge = self.edges[edge]
+        edge.annotations.remove_all(edge.annotations)
+        self.edges.remove(edge)
+
+    def remove_node(self, node):
+        """Removes the given C{Node}, or the node with the given id, from
+        this graph, along with its edges, its links to regions and its
+        annotations. The regions themselves are kept.
+
+        :param node: C{Node} or C{str}
+        """
+        if not isinstance(node, Node):
+            node = self.nodes[node]
+        for edge in list(node.in_edges) + list(node.out_edges):
+            if edge.id in self.edges:
+                self.remove_edge(edge)
+        for link in node.links:
+            for region in link:
+                region.nodes.remove(node)
+        node.annotations.remove_all(node.annotations)
+        del self.nodes[node.id]
+        if node.id in self.header.roots:
+            self.header.roots.remove(node.id)
+
+    def remove_region(self, region):
+        """Removes the given C{Region}, or the region with the given id,
+        from this graph and from the links of the nodes that refer to it.
+        Links left empty are dropped.
+
+        :param region: C{Region} or C{str}
+        """
+        if not isinstance(region, Region):
+            region = self.regions[region]
+        for node in region.nodes:
+            node.links = [link for link in
+                          (Link(r for r in link if r is not region)
+                           for link in node.links) if link]
+            node.invalidate_span()
+        region.nodes = []
+        del self.regions[region.id]
+
+    def remove_where(self, nodes=None, edges=None, regions=None):
+        """Removes all nodes, edges and regions for which the given
+        predicates return True, in a single pass over the graph. Edges of
+        removed nodes are removed too. This is much faster than removing
+        many elements one at a time.
+
+        Parameters
+        ----------
+        nodes : function, optional
+            Predicate called with each C{Node}.
+        edges : function, optional
+            Predicate called with each C{Edge}.
+        regions : function, optional
+            Predicate called with each C{Region}.
+
+        Returns
+        -------
+        res : tuple of int
+            The number of nodes, edges and regions removed.
+
+        """
+        dead_nodes = [node for node in self.nodes if nodes(node)] \
+            if nodes is not None else []
+        dead_node_ids = set(id(node) for node in dead_nodes)
+        dead_edges = [edge for edge in self.edges
+                      if id(edge.from_node) in dead_node_ids
+                      or id(edge.to_node) in dead_node_ids
+                      or (edges is not None and edges(edge))]
+        dead_regions = [region for region in self.regions
+                        if regions(region)] if regions is not None else []
+        dead_region_ids = set(id(region) for region in dead_regions)
+
+        for element in dead_nodes + dead_edges:
+            element.annotations.remove_all(element.annotations)
+
+        self.edges.remove_all(dead_edges)
+
+        # Region back-references and links
+        linked = {}
+        for region in dead_regions:
+            for node in region.nodes:
+                linked[id(node)] = node
+            region.nodes = []
+            del self.regions[region.id]
+        for node in linked.values():
+            if id(node) not in dead_node_ids:
+                node.links = [link for link in
+                              (Link(r for r in link
+                                    if id(r) not in dead_region_ids)
+                               for link in node.links) if link]
+                node.invalidate_span()
+        for node in dead_nodes:
+            for link in node.links:
+                for region in link:
+                    if region.nodes:
+                        region.nodes = [n for n in region.nodes
+                                        if id(n) not in dead_node_ids]
+            del self.nodes[node.id]
+
+        if dead_nodes:
+            self.header.roots = [root for root in self.header.roots
+                                 if root in self.nodes]
+        return len(dead_nodes), len(dead_edges), len(dead_regions)
+
     @property
     def root(self):
         try:
@@ -207,6 +562,326 @@ class Graph(object):
     def iter_roots(self):
         return (self.nodes[id] for id in self.header.roots)
 
+    # Traversal. All traversals are iterative and keep their visited node
+    # ids in a local set rather than in Node.visited, so they work on
+    # graphs of any depth and several of them may run at the same time.
+
+    def _start_nodes(self, start):
+        if start is None:
+            start = list(self.iter_roots()) or [
+                node for node in self.nodes if not node.in_edges]
+        else:
+            try:
+                # A single node or node id
+                single = start in self.nodes
+            except TypeError:
+                single = False
+            if single or isinstance(start, Node):
+                start = [start]
+        return [node if isinstance(node, Node) else self.nodes[node]
+                for node in start]
+
+    def iter_bfs(self, start=None):
+        """Generates the nodes reachable from the given node(s) in
+        breadth-first order, each once.
+
+        :param start: a C{Node} or id, or a list of them. Defaults to the
+            roots of the graph, or the nodes without parents if there are
+            no roots.
+        """
+        queue = deque(self._start_nodes(start))
+        visited = set(node.id for node in queue)
+        while queue:
+            node = queue.popleft()
+            yield node
+            for child in node.iter_children():
+                if child.id not in visited:
+                    visited.add(child.id)
+                    queue.append(child)
+
+    def iter_dfs(self, start=None):
+        """Generates the nodes reachable from the given node(s) in
+        depth-first pre-order, each once.
+
+        :param start: as for L{iter_bfs}
+        """
+        stack = list(reversed(self._start_nodes(start)))
+        visited = set()
+        while stack:
+            node = stack.pop()
+            if node.id in visited:
+                continue
+            visited.add(node.id)
+            yield node
+            children = [child for child in node.iter_children()
+                        if child.id not in visited]
+            stack.extend(reversed(children))
+
+    def iter_descendants(self, node):
+        """Generates the descendants of the given node, each once"""
+        it = self.iter_bfs(node)
+        next(it)
+        return it
+
+    def iter_ancestors(self, node):
+        """Generates the ancestors of the given node, each once, nearest
+        first"""
+        node = self._start_nodes(node)[0]
+        queue = deque([node])
+        visited = set([node.id])
+        while queue:
+            for parent in queue.popleft().iter_parents():
+                if parent.id not in visited:
+                    visited.add(parent.id)
+                    queue.append(parent)
+                    yield parent
+
+    def topological_sort(self, nodes=None):
+        """Returns the given nodes (all nodes of the graph if None) so that
+        every node comes before its children. Only the edges between the
+        given nodes are taken into account.
+
+        :raises ValueError: if the nodes contain a cycle
+        """
+        if nodes is None:
+            nodes = self.nodes
+        nodes = list(nodes)
+        indegree = dict((node.id, 0) for node in nodes)
+        for node in nodes:
+            for child in node.iter_children():
+                if child.id in indegree:
+                    indegree[child.id] += 1
+
+        res = [node for node in nodes if indegree[node.id] == 0]
+        # res doubles as the queue of nodes whose parents are all sorted
+        i = 0
+        while i < len(res):
+            for child in res[i].iter_children():
+                if child.id in indegree:
+                    indegree[child.id] -= 1
+                    if indegree[child.id] == 0:
+                        res.append(child)
+            i += 1
+
+        if len(res) != len(nodes):
+            raise ValueError('The graph contains a cycle')
+        return res
+
+    def node_spans(self, nodes=None):
+        """Computes the (start, end) anchors of the text covered by the
+        given nodes, in one pass.
+
+        The span of a node with links covers all its linked regions; the
+        span of any other node is the union of the spans of its children.
+        Spans are cached on the nodes (see L{Node.span}), so each one is
+        computed once, however many nodes share it.
+
+        Parameters
+        ----------
+        nodes : iterable of graf.Node, optional
+            The nodes to compute spans for. All nodes if None.
+
+        Returns
+        -------
+        spans : dict
+            Maps the ids of the given nodes to their (start, end) pair, or
+            to None if they cover no text.
+
+        """
+        if nodes is None:
+            nodes = self.nodes
+        spans = {}
+        for node in nodes:
+            spans[node.id] = node.span
+        return spans
+
+    def texts(self, nodes, primary_data=None):
+        """Returns the texts covered by the given nodes, or None for the
+        nodes that cover no text.
+
+        :param nodes: C{list} of C{Node}
+        :param primary_data: C{PrimaryData}, defaults to the graph's
+        :return: C{list} of C{str}
+        """
+        if primary_data is None:
+            primary_data = self.primary_data
+        if primary_data is None:
+            raise ValueError('The graph has no primary data')
+        nodes = list(nodes)
+        spans = self.node_spans(nodes)
+        res = []
+        for node in nodes:
+            span = spans[node.id]
+            res.append(None if span is None else primary_data.text(*span))
+        return res
+
+    def view(self, aspaces=None, labels=None):
+        """Returns a read-only C{GraphView} of this graph restricted to the
+        annotations in the given annotation spaces and/or with the given
+        labels. Nothing is copied: the view filters lazily on iteration.
+
+        Parameters
+        ----------
+        aspaces : iterable of str or AnnotationSpace, optional
+            The annotation spaces to keep. All are kept if None.
+        labels : iterable of str, optional
+            The annotation labels to keep. All are kept if None.
+
+        Returns
+        -------
+        res : graf.GraphView
+
+        """
+        return GraphView(self, aspaces, labels)
+
+
+class ElementView(object):
+    """
+    A read-only, lazily filtered view of an C{IdDict} of graph elements.
+    Supports iteration, id lookup and membership tests like the
+    underlying collection.
+    """
+
+    __slots__ = ('_elements', '_accepts')
+
+    def __init__(self, elements, accepts):
+        self._elements = elements
+        self._accepts = accepts
+
+    def __iter__(self):
+        accepts = self._accepts
+        return (el for el in self._elements if accepts(el))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, obj):
+        id = getattr(obj, 'id', obj)
+        try:
+            el = dict.__getitem__(self._elements, id)
+        except KeyError:
+            return False
+        return self._accepts(el)
+
+    def __getitem__(self, id):
+        el = dict.__getitem__(self._elements, id)
+        if not self._accepts(el):
+            raise KeyError(id)
+        return el
+
+    def get(self, id, default=None):
+        try:
+            return self[id]
+        except KeyError:
+            return default
+
+
+class GraphView(object):
+    """
+    A read-only view of a C{Graph} that only exposes the annotations in
+    the selected annotation spaces and with the selected labels, the nodes
+    carrying such annotations, and the edges and regions between them.
+    Several views can share a single parsed graph, since filtering happens
+    on iteration and the graph is never copied or modified.
+    """
+
+    def __init__(self, graph, aspaces=None, labels=None):
+        """Constructor for C{GraphView}.
+
+        :param graph: C{Graph}
+        :param aspaces: C{list} of annotation space ids or C{AnnotationSpace}
+        :param labels: C{list} of C{str}
+
+        """
+        self.graph = graph
+        self.aspaces = None
+        if aspaces is not None:
+            self.aspaces = frozenset(getattr(aspace, 'as_id', aspace)
+                                     for aspace in aspaces)
+        self.labels = frozenset(labels) if labels is not None else None
+        self.nodes = ElementView(graph.nodes, self._accepts_node)
+        self.edges = ElementView(graph.edges, self._accepts_edge)
+        self.regions = ElementView(graph.regions, self._accepts_region)
+
+    def __repr__(self):
+        return "GraphView(aspaces=%r, labels=%r)" % (
+            self.aspaces and sorted(self.aspaces),
+            self.labels and sorted(self.labels))
+
+    @property
+    def is_filtered(self):
+        return self.aspaces is not None or self.labels is not None
+
+    def accepts(self, ann):
+        """Returns True if the given C{Annotation} is visible in this view"""
+        if self.labels is not None and ann.label not in self.labels:
+            return False
+        if self.aspaces is not None:
+            return ann.aspace is not None and ann.aspace.as_id in self.aspaces
+        return True
+
+    def iter_annotations(self, element):
+        """Generates the visible annotations of the given node or edge"""
+        accepts = self.accepts
+        return (ann for ann in element.annotations if accepts(ann))
+
+    @property
+    def annotations(self):
+        """Generates all visible annotations in the graph. When annotation
+        spaces are selected only those spaces are traversed."""
+        if self.aspaces is not None:
+            spaces = self.graph.annotation_spaces
+            return (ann for as_id in sorted(self.aspaces) if as_id in spaces
+                    for ann in spaces[as_id] if self.accepts(ann))
+        return (ann for elements in (self.graph.nodes, self.graph.edges)
+                for element in elements
+                for ann in self.iter_annotations(element))
+
+    def _accepts_node(self, node):
+        if not self.is_filtered:
+            return True
+        for ann in node.annotations:
+            if self.accepts(ann):
+                return True
+        return False
+
+    def _accepts_edge(self, edge):
+        if not self.is_filtered:
+            return True
+        for ann in edge.annotations:
+            if self.accepts(ann):
+                return True
+        return (self._accepts_node(edge.from_node) and
+                self._accepts_node(edge.to_node))
+
+    def _accepts_region(self, region):
+        if not self.is_filtered:
+            return True
+        for node in region.nodes:
+            if self._accepts_node(node):
+                return True
+        return False
+
+    def iter_roots(self):
+        return (node for node in self.graph.iter_roots()
+                if self._accepts_node(node))
+
+    def view(self, aspaces=None, labels=None):
+        """Returns a view further restricted by the given aspaces and labels"""
+        if aspaces is not None:
+            aspaces = set(getattr(aspace, 'as_id', aspace) for aspace in aspaces)
+            if self.aspaces is not None:
+                aspaces &= self.aspaces
+        else:
+            aspaces = self.aspaces
+        if labels is not None:
+            labels = set(labels)
+            if self.labels is not None:
+                labels &= self.labels
+        else:
+            labels = self.labels
+        return GraphView(self.graph, aspaces, labels)
+
 
 class GraphElement(object):
     """
@@ -253,23 +928,51 @@ class GraphElement(object):
 
 
 class EdgeList(object):
-    """An append-only structure with O(1) lookup by id or order-index"""
+    """An ordered structure with O(1) lookup by id or order-index
 
-    __slots__ = ('_by_ind', '_by_id')
+    Edges are removed in constant time, like annotations from an
+    C{AnnotationList}: their slot is cleared and the list is compacted
+    once more than half of it is empty.
+    """
+
+    __slots__ = ('_by_ind', '_by_id', '_positions', '_holes')
+
+    # Lists shorter than this are never compacted
+    MIN_COMPACT = 32
 
     def __init__(self):
         self._by_ind = []
         self._by_id = {}
+        # id() of each edge -> its index in _by_ind
+        self._positions = {}
+        self._holes = 0
 
     def add(self, edge):
         self._by_id[edge.id] = edge
+        self._positions[id(edge)] = len(self._by_ind)
         self._by_ind.append(edge)
 
+    def remove(self, edge):
+        """Removes the given edge"""
+        del self._by_id[edge.id]
+        self._by_ind[self._positions.pop(id(edge))] = None
+        self._holes += 1
+        if (self._holes > self.MIN_COMPACT and
+                2 * self._holes > len(self._by_ind)):
+            self._compact()
+
+    def _compact(self):
+        if self._holes:
+            self._by_ind = [edge for edge in self._by_ind if edge is not None]
+            self._positions = dict((id(edge), i)
+                                   for i, edge in enumerate(self._by_ind))
+            self._holes = 0
+
     def __iter__(self):
-        return iter(self._by_ind)
+        return (edge for edge in self._by_ind if edge is not None)
 
     def __len__(self):
-        return len(self._by_ind)
+        return len(self._by_ind) - self._holes
 
     def __getitem__(self, sl):
         """
@@ -278,6 +981,7 @@ class EdgeList(object):
         """
         # should ID lookup have preference??
         if isinstance(sl, (int, slice)):
+            self._compact()
             return self._by_ind[sl]
         return self._by_id[sl]
 
@@ -306,10 +1010,26 @@ class Node(GraphElement):
         self.in_edges = EdgeList()
         self.out_edges = EdgeList()
         self.links = []
+        # Cached span: None if unknown, () if the node covers no text
+        self._span = None
 
     def __repr__(self):
         return "NodeID = " + self.id
 
+    def __getstate__(self):
+        # A node pickled on its own does not carry its edges, which would
+        # recurse through the whole graph. Pickle the Graph to keep them.
+        state = self.__dict__.copy()
+        state['in_edges'] = state['out_edges'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.in_edges = EdgeList()
+        self.out_edges = EdgeList()
+        for link in self.links:
+            self._add_regions(link)
+
     def __lt__(self, other):
         return self.id < other.id
 
@@ -318,6 +1038,7 @@ class Node(GraphElement):
     def add_link(self, link):
         self.links.append(link)
         self._add_regions(link)
+        self.invalidate_span()
 
     def _add_regions(self, regions):
         for region in regions:
@@ -328,9 +1049,36 @@ class Node(GraphElement):
         if self.links:
             self.links[0].append(region)
             self._add_regions((region,))
+            self.invalidate_span()
         else:
             self.add_link(Link((region,)))
 
+    @property
+    def span(self):
+        """The (start, end) anchors of the text covered by this node, or
+        None. A node with links spans its linked regions, any other node
+        the union of its children's spans.
+
+        Spans are cached and computed bottom-up for all descendants at
+        once, so querying every node of a document costs linear time.
+        Adding links or edges through the graph invalidates the cached
+        spans of the node and its ancestors; call L{invalidate_span} after
+        changing the anchors of a region in place.
+        """
+        if self._span is None:
+            _compute_spans(self)
+        return self._span or None
+
+    def invalidate_span(self):
+        """Clears the cached span of this node and of all its ancestors"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            # The ancestors of a node without a cached span have none either
+            if node._span is not None:
+                node._span = None
+                stack.extend(node.iter_parents())
+
     # Relationship within graph
     def iter_parents(self):
         for edge in self.in_edges:
@@ -358,9 +1106,12 @@ class Node(GraphElement):
         """Clears this node's visited status and those of all visited descendents"""
         self.visited = False
 
-        for child in self.iter_children():
-            if child.visited:
-                child.clear()
+        stack = [self]
+        while stack:
+            for child in stack.pop().iter_children():
+                if child.visited:
+                    child.visited = False
+                    stack.append(child)
 
     @property
     def degree(self):
@@ -427,6 +1178,8 @@ class GraphHeader(object):
         self.annotation_spaces = {}
         self.depends_on = []
         self.roots = []
+        # Annotation space id -> f.id of the file it was read from
+        self.layers = {}
 
     def __repr__(self):
         return "GraphHeader"
@@ -456,31 +1209,42 @@ class StandoffHeader(object):
         ----------
         version : str
             Version of the document header file.
-        filedesc : ElementTree
-            Element with the description of the file.
-        profiledesc : ElementTree
-            Element with the description of the source file.
-        datadesc : ElementTree
-            Element with the description of the annotations.
+        filedesc : FileDesc
+            Description of the file.
+        profiledesc : ProfileDesc
+            Description of the source file.
+        datadesc : DataDesc
+            Description of the annotations.
+        doc_id : str
+            Identifier of the document. Generated when rendering if None.
+        creator : str
+            Creator of the header. The current user when rendering if None.
+        date_created : str
+            Creation date of the header. Today when rendering if None.
 
         """
 
         self._kwargs = kwargs
         
         self.version = version
-        self.filedesc = self._get_key_value('fileDesc')
-        self.profiledesc = self._get_key_value('profilDesc')
-        self.datadesc = self._get_key_value('dataDesc')
+        self.filedesc = self._get_key_value('filedesc')
+        self.profiledesc = self._get_key_value('profiledesc')
+        self.datadesc = self._get_key_value('datadesc')
+        self.doc_id = kwargs.get('doc_id')
+        self.creator = kwargs.get('creator')
+        self.date_created = kwargs.get('date_created')
 
     def __repr__(self):
         return "StandoffHeader"
 
     def _get_key_value(self, key):
-        if key == 'fileDesc':
+        if self._kwargs.get(key) is not None:
+            return self._kwargs[key]
+        if key == 'filedesc':
             return FileDesc()
-        if key == 'profilDesc':
+        if key == 'profiledesc':
             return ProfileDesc()
-        if key == 'dataDesc':
+        if key == 'datadesc':
             return DataDesc(None)
 
         return None
@@ -636,6 +1400,9 @@ class ProfileDesc(object):
 
         """
 
+        if self.languages is None:
+            self.languages = []
+
         self.languages.append(language_code)
 
     def add_participant(self, id, age=None, sex=None, role=None):
@@ -672,6 +1439,9 @@ class ProfileDesc(object):
         if role:
             participant['role'] = role
 
+        if self.participants is None:
+            self.participants = []
+
         self.participants.append(participant)
 
     def add_setting(self, who, time, activity, locale):
@@ -702,6 +1472,9 @@ class ProfileDesc(object):
 
         """
 
+        if self.settings is None:
+            self.settings = []
+
         self.settings.append({'who': who, 'time': time, 'activity': activity,
                               'locale': locale})
 
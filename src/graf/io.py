@@ -9,22 +9,390 @@
 
 import sys
 import os
-import codecs
 import datetime
 import getpass
 import random
+import posixpath
+import shutil
+import tempfile
+import threading
 from operator import attrgetter
 
 from xml.sax import make_parser, SAXException
 from xml.sax.handler import ContentHandler
-from xml.dom import minidom
+from xml.sax.saxutils import escape
 
 
-from xml.etree.ElementTree import Element, SubElement, tostring
+from xml.etree.ElementTree import Element, SubElement
 
-from graf.graphs import Graph, Link
+from graf.graphs import Graph, Link, StandoffHeader, FileDesc, ProfileDesc, \
+    DataDesc
 from graf.annotations import Annotation, FeatureStructure
-from graf.media import CharAnchor, Region
+from graf.media import CharAnchor, PrimaryData, Region
+
+if sys.version_info[:2] >= (3, 0):
+    from sys import intern
+    text_type = str
+else:
+    # Python 2 only interns byte strings, and SAX yields unicode
+    def intern(value):
+        return value
+    text_type = unicode
+
+# Size of the blocks in which files are read and fed to the parser
+CHUNK_SIZE = 64 * 1024
+
+# Compression formats by file extension and by magic bytes
+COMPRESSION_EXTENSIONS = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'xz',
+    '.lzma': 'xz',
+    '.zst': 'zstd',
+}
+COMPRESSION_MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+)
+
+
+def split_compression_ext(filename):
+    """Splits a compression extension (e.g. '.gz') off the given file name.
+
+    :return: (filename without the extension, compression format or None)
+    """
+    root, ext = os.path.splitext(filename)
+    if ext.lower() in COMPRESSION_EXTENSIONS:
+        return root, COMPRESSION_EXTENSIONS[ext.lower()]
+    return filename, None
+
+
+def _compressed_stream(compression, filename, mode):
+    if compression == 'gzip':
+        import gzip
+        return gzip.GzipFile(filename, mode)
+    if compression == 'bz2':
+        import bz2
+        return bz2.BZ2File(filename, mode)
+    if compression == 'xz':
+        import lzma
+        return lzma.LZMAFile(filename, mode)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('Reading or writing zstd compressed files '
+                              'requires the zstandard package')
+        raw = open(filename, mode)
+        if 'r' in mode:
+            return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+    raise ValueError('Unknown compression format %r' % compression)
+
+
+def open_file(filename, mode='rb'):
+    """Opens a GrAF file as a binary stream, transparently decompressing or
+    compressing it.
+
+    For reading, the compression format is detected from the first bytes of
+    the file, and if the file does not exist, the same name with one of the
+    known compression extensions is tried, so that e.g. a dependency on
+    'doc-word.xml' is resolved to 'doc-word.xml.gz'. For writing, the format
+    is given by the extension of the file name. Data is (de)compressed on
+    the fly, never staged as a whole.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the file.
+    mode : str
+        'rb' or 'wb'.
+
+    """
+    if 'w' in mode:
+        compression = split_compression_ext(filename)[1]
+        if compression is None:
+            return open(filename, 'wb')
+        return _compressed_stream(compression, filename, 'wb')
+
+    if not os.path.exists(filename):
+        for ext in COMPRESSION_EXTENSIONS:
+            if os.path.exists(filename + ext):
+                filename += ext
+                break
+
+    raw = open(filename, 'rb')
+    magic = raw.read(6)
+    for prefix, compression in COMPRESSION_MAGIC:
+        if magic.startswith(prefix):
+            raw.close()
+            return _compressed_stream(compression, filename, 'rb')
+    raw.seek(0)
+    return raw
+
+
+def decompress_stream(stream):
+    """Wraps a binary stream, e.g. an archive member, into a decompressing
+    stream if its first bytes are those of a known compression format.
+    The stream must support peek(), as the streams of zip and tar members
+    do; other streams are returned unchanged."""
+    if not hasattr(stream, 'peek'):
+        return stream
+    magic = stream.peek(6)[:6]
+    for prefix, compression in COMPRESSION_MAGIC:
+        if magic.startswith(prefix):
+            break
+    else:
+        return stream
+
+    if compression == 'gzip':
+        import gzip
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if compression == 'bz2':
+        import bz2
+        return bz2.BZ2File(stream, 'rb')
+    if compression == 'xz':
+        import lzma
+        return lzma.LZMAFile(stream, 'rb')
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('Reading zstd compressed files requires the '
+                          'zstandard package')
+    return zstandard.ZstdDecompressor().stream_reader(stream, closefd=True)
+
+
+class FileSource(object):
+    """
+    The source from which L{GraphParser} opens headers, annotation files
+    and their dependencies. This default source reads them from the file
+    system, through L{open_file}.
+    """
+
+    def open(self, name):
+        """Returns a binary stream for the file with the given name"""
+        return open_file(name)
+
+    def exists(self, name):
+        return os.path.exists(name) or any(
+            os.path.exists(name + ext) for ext in COMPRESSION_EXTENSIONS)
+
+    def dirname(self, name):
+        return os.path.dirname(name)
+
+    def join(self, dirname, name):
+        return os.path.join(dirname, name)
+
+    def normalize(self, name):
+        return os.path.abspath(name)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ArchiveSource(FileSource):
+    """
+    Base class of the sources that read the members of an archive in place,
+    without extracting it. Member names always use '/' as separator.
+    A source opened from a path can be pickled, e.g. with the primary data
+    of a graph read from the archive.
+    """
+
+    def names(self):
+        """Returns the names of all the files in the archive"""
+        raise NotImplementedError()
+
+    def exists(self, name):
+        try:
+            self._resolve(name)
+        except IOError:
+            return False
+        return True
+
+    def dirname(self, name):
+        return posixpath.dirname(name)
+
+    def join(self, dirname, name):
+        return posixpath.join(dirname, name)
+
+    def normalize(self, name):
+        return posixpath.normpath(name.replace(os.sep, '/'))
+
+    def _members(self):
+        raise NotImplementedError()
+
+    def __getstate__(self):
+        # Pickled as the path of the archive, which is opened again
+        if self._path is None:
+            raise TypeError('Cannot pickle a %s opened from a file object'
+                            % type(self).__name__)
+        return self._path
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def _resolve(self, name):
+        """Returns the member name for the given file name, trying the
+        known compression extensions like L{open_file} does."""
+        name = self.normalize(name)
+        members = self._members()
+        if name in members:
+            return name
+        for ext in COMPRESSION_EXTENSIONS:
+            if name + ext in members:
+                return name + ext
+        raise IOError('No file %r in the archive' % name)
+
+
+class ZipSource(ArchiveSource):
+    """
+    Reads GrAF files directly out of a ZIP archive, with random access by
+    member name.
+    """
+
+    def __init__(self, archive):
+        """Constructor for C{ZipSource}.
+
+        :param archive: path or binary file object of the ZIP archive
+
+        """
+        import zipfile
+        self._archive = zipfile.ZipFile(archive)
+        self._path = None if hasattr(archive, 'read') else archive
+        self._names = None
+
+    def _members(self):
+        if self._names is None:
+            self._names = dict((self.normalize(name), name)
+                               for name in self._archive.namelist()
+                               if not name.endswith('/'))
+        return self._names
+
+    def names(self):
+        return list(self._members())
+
+    def open(self, name):
+        member = self._members()[self._resolve(name)]
+        return decompress_stream(self._archive.open(member))
+
+    def close(self):
+        self._archive.close()
+
+
+class _LockedStream(object):
+    """
+    A binary stream read while holding a lock, for streams that share an
+    underlying file object with other streams.
+    """
+
+    def __init__(self, stream, lock):
+        self._stream = stream
+        self._lock = lock
+
+    def read(self, size=-1):
+        with self._lock:
+            return self._stream.read(size)
+
+    def peek(self, size=0):
+        with self._lock:
+            return self._stream.peek(size)
+
+    def readable(self):
+        return True
+
+    def close(self):
+        with self._lock:
+            self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TarSource(ArchiveSource):
+    """
+    Reads GrAF files directly out of a (possibly compressed) tar archive.
+    The member index is built once; members are then streamed by name.
+    All members are read through the same file object, so the members
+    opened from several threads are read in turn.
+    """
+
+    def __init__(self, archive):
+        """Constructor for C{TarSource}.
+
+        :param archive: path or binary file object of the tar archive
+
+        """
+        import tarfile
+        self._lock = threading.Lock()
+        if hasattr(archive, 'read'):
+            self._archive = tarfile.open(fileobj=archive)
+            self._path = None
+        else:
+            self._archive = tarfile.open(archive)
+            self._path = archive
+        self._index = None
+
+    def _members(self):
+        with self._lock:
+            if self._index is None:
+                self._index = dict((self.normalize(member.name), member)
+                                   for member in self._archive.getmembers()
+                                   if member.isfile())
+        return self._index
+
+    def names(self):
+        return list(self._members())
+
+    def open(self, name):
+        member = self._members()[self._resolve(name)]
+        with self._lock:
+            stream = self._archive.extractfile(member)
+        return decompress_stream(_LockedStream(stream, self._lock))
+
+    def close(self):
+        self._archive.close()
+
+
+XML_DECLARATION = '<?xml version="1.0" encoding="utf-8"?>\n'
+
+
+def _start_tag(element, close=False):
+    attrs = ''.join(' %s="%s"' % (name, escape(text_type(value),
+                                                {'"': '&quot;'}))
+                    for name, value in element.attrib.items())
+    return '<%s%s%s>' % (element.tag, attrs, '/' if close else '')
+
+
+def write_element(output, element, level=0, indent='\t'):
+    """Writes an ElementTree element and its children to a binary stream,
+    indented like minidom's toprettyxml but without building a DOM.
+    Element tails are ignored."""
+    prefix = indent * level
+    text = element.text
+    if len(element):
+        lines = [prefix, _start_tag(element), '\n']
+        if text:
+            lines.extend((prefix, indent, escape(text), '\n'))
+        output.write(''.join(lines).encode('utf-8'))
+        for child in element:
+            write_element(output, child, level + 1, indent)
+        output.write(('%s</%s>\n' % (prefix, element.tag)).encode('utf-8'))
+    elif text:
+        output.write(('%s%s%s</%s>\n' % (prefix, _start_tag(element),
+                                          escape(text), element.tag)).encode('utf-8'))
+    else:
+        output.write((prefix + _start_tag(element, True) + '\n').encode('utf-8'))
 
 
 class Constants(object):
@@ -95,6 +463,15 @@ class Constants(object):
     DEFAULT = "default"
 
 
+def _region_key(region):
+    # The order of Region.__lt__: by number of anchors, then by anchors
+    return len(region.anchors), region.anchors
+
+
+def _edge_key(edge):
+    return edge.pos if edge.pos is not None else 0
+
+
 class GrafRenderer(object):
     """
     Renders a GrAF XML representation that can be read back by an instance
@@ -104,12 +481,37 @@ class GrafRenderer(object):
 
     """
 
-    def __init__(self, outputfile):
+    # Bytes of rendered elements kept in memory, while the labels are
+    # counted, before they are spilled to a temporary file
+    SPOOL_SIZE = 16 * 1024 * 1024
+
+    # Orders in which the regions, nodes and edges can be written
+    SORTED = 'sorted'
+    INSERTION = 'insertion'
+
+    def __init__(self, outputfile, order=SORTED):
         """Create an instance of a GrafRenderer.
 
+        :param outputfile: path of the file to write
+        :param order: C{GrafRenderer.SORTED} to write the regions, nodes and
+            edges sorted by anchors, id and position, or
+            C{GrafRenderer.INSERTION} to write them in the order they were
+            added to the graph, e.g. the order of the parsed files, without
+            sorting
+
         """
 
+        if order not in (self.SORTED, self.INSERTION):
+            raise ValueError('Unknown render order %r' % (order,))
         self.outputfile = outputfile
+        self.order = order
+
+    def _ordered(self, elements, key):
+        # Sorting by key computes the key once per element, instead of
+        # calling __lt__ for each comparison
+        if self.order == self.INSERTION:
+            return elements
+        return sorted(elements, key=key)
 
     def render_node(self, n):
         """
@@ -154,7 +556,10 @@ class GrafRenderer(object):
         Used to render the annotation elements of the Graph.
         """
 
-        annotation = Element('a', {'as': a.label, 'label': a.label,
+        # 'as' refers to an annotation space declared in the graph header;
+        # annotations outside of any space keep their label there
+        as_id = a.aspace.as_id if a.aspace is not None else a.label
+        annotation = Element('a', {'as': as_id, 'label': a.label,
                                    'ref': a.element.id, 'xml:id': a.id})
 
         if a.features:
@@ -186,29 +591,32 @@ class GrafRenderer(object):
         """
 
         feature = Element('f', {'name': name})
-        feature.text = value
+        if isinstance(value, FeatureStructure):
+            feature.append(self.render_fs(value))
+        else:
+            feature.text = value
 
         return feature
 
-    def write_header(self, g):
+    def write_header(self, g, labels=None):
         """
         Writes the header tag at the beginning of the XML file.
         """
 
         header = Element('graph', {'xmlns': 'http://www.xces.org/ns/GrAF/1.0/'})
 
-        header.append(self.write_header_elements(g))
+        header.append(self.write_header_elements(g, labels))
 
         return header
 
-    def write_header_elements(self, g):
+    def write_header_elements(self, g, labels=None):
         """
         Helper method for write_header.
         """
 
         graph_header = Element('graphHeader')
 
-        graph_header.append(self.render_tag_usage(g))
+        graph_header.append(self.render_tag_usage(g, labels))
 
         depends_on = g.header.depends_on
         dependencies = SubElement(graph_header, 'dependencies')
@@ -236,14 +644,15 @@ class GrafRenderer(object):
 
     def count_tag_usage(self, g):
         annotations = {}
-        for node in g.nodes:
-            for a in node.annotations:
-                count = annotations.setdefault(a.label, 0)
-                annotations[a.label] = count + 1
+        for elements in (g.nodes, g.edges):
+            for element in elements:
+                for a in element.annotations:
+                    annotations[a.label] = annotations.get(a.label, 0) + 1
         return annotations
 
-    def render_tag_usage(self, g):
-        annotations = self.count_tag_usage(g)
+    def render_tag_usage(self, g, annotations=None):
+        if annotations is None:
+            annotations = self.count_tag_usage(g)
 
         labels_decl = Element('labelsDecl')
 
@@ -252,40 +661,64 @@ class GrafRenderer(object):
 
         return labels_decl
 
-    def render(self, g):
+    def render_body(self, g, output, labels):
+        """
+        Writes the regions, nodes and edges of the graph, each followed by
+        its annotations, to the given binary stream, and counts the usage
+        of each annotation label in C{labels} in the same pass.
 
-        header = self.write_header(g)
+        The graph may also be a C{graf.render.GraphLayer}, which selects
+        the annotations of its elements with C{iter_annotations} and has
+        annotations of elements of other layers.
+        """
 
-        # render regions
-        for region in sorted(g.regions):
-            header.append(self.render_region(region))
+        iter_annotations = getattr(g, 'iter_annotations',
+                                   attrgetter('annotations'))
 
-        # render nodes
-        nodes = sorted(g.nodes)
-        for node in nodes:
-            header.append(self.render_node(node))
-            for a in node.annotations:
-                header.append(self.render_ann(a))
+        def render_annotation(a):
+            labels[a.label] = labels.get(a.label, 0) + 1
+            write_element(output, self.render_ann(a), 1)
 
-            # for region in g.regions:
-            #     for region_node in region.nodes:
-            #         if region_node.id == node.id:
-            #             header.append(self.render_region(region))
+        def render_annotations(element):
+            for a in iter_annotations(element):
+                render_annotation(a)
 
-            # for edge in g.edges:
-            #     if edge.to_node.id == node.id:
-            #         header.append(self.render_edge(edge))
+        for region in self._ordered(g.regions, _region_key):
+            write_element(output, self.render_region(region), 1)
 
-        # render edges
-        for edge in sorted(g.edges, key=lambda e: e.pos
-                if e.pos is not None else 0):
-            header.append(self.render_edge(edge))
+        for node in self._ordered(g.nodes, attrgetter('id')):
+            write_element(output, self.render_node(node), 1)
+            render_annotations(node)
 
-        doc = minidom.parseString(tostring(header, encoding="utf-8"))
+        for edge in self._ordered(g.edges, _edge_key):
+            write_element(output, self.render_edge(edge), 1)
+            render_annotations(edge)
 
-        output = open(self.outputfile, "wb")
-        output.write(doc.toprettyxml(encoding='utf-8'))
-        output.close()
+        for a in getattr(g, 'external_annotations', ()):
+            render_annotation(a)
+
+    def render(self, g):
+        # The label usage is only known once the body is rendered, so the
+        # body is spooled and written after the header
+        labels = {}
+        body = tempfile.SpooledTemporaryFile(self.SPOOL_SIZE)
+        try:
+            self.render_body(g, body, labels)
+            header = self.write_header(g, labels)
+
+            output = open_file(self.outputfile, "wb")
+            try:
+                output.write(XML_DECLARATION.encode('utf-8'))
+                output.write((_start_tag(header) + '\n').encode('utf-8'))
+                for element in header:
+                    write_element(output, element, 1)
+                body.seek(0)
+                shutil.copyfileobj(body, output)
+                output.write(b'</graph>\n')
+            finally:
+                output.close()
+        finally:
+            body.close()
 
 
 class StandoffHeaderRenderer(object):
@@ -303,28 +736,40 @@ class StandoffHeaderRenderer(object):
 
         """
 
-        now = datetime.datetime.now()
-        pubDate = now.strftime("%Y-%m-%d")
+        documentheader = self._documentheader_element(standoffheader)
+        documentheader.append(self.render_filedesc(standoffheader.filedesc))
+        documentheader.append(self._profiledesc_element(standoffheader))
 
-        documentheader = Element('documentHeader',
-                                 {"xmlns": "http://www.xces.org/ns/GrAF/1.0/",
-                                  "xmlns:xlink": "http://www.w3.org/1999/xlink",
-                                  "docId": "PoioAPI-" + str(random.randint(1, 1000000)),
-                                  "version": standoffheader.version,
-                                  "creator": getpass.getuser(),
-                                  "date.created": pubDate})
+        return documentheader
 
-        filedesc = self.render_filedesc(standoffheader.filedesc)
+    def _documentheader_element(self, standoffheader):
+        """The documentHeader element, without children. The id, creator
+        and creation date of the header are kept if it was read from a
+        file, and generated otherwise."""
+        doc_id = standoffheader.doc_id
+        if doc_id is None:
+            doc_id = "PoioAPI-" + str(random.randint(1, 1000000))
+        creator = standoffheader.creator
+        if creator is None:
+            creator = getpass.getuser()
+        date_created = standoffheader.date_created
+        if date_created is None:
+            date_created = datetime.datetime.now().strftime("%Y-%m-%d")
+
+        return Element('documentHeader',
+                       {"xmlns": "http://www.xces.org/ns/GrAF/1.0/",
+                        "xmlns:xlink": "http://www.w3.org/1999/xlink",
+                        "docId": doc_id,
+                        "version": standoffheader.version,
+                        "creator": creator,
+                        "date.created": date_created})
+
+    def _profiledesc_element(self, standoffheader):
+        # The primary data and the annotations are part of the profileDesc
         profiledesc = self.render_profiledesc(standoffheader.profiledesc)
-        datadesc = self.render_datadesc(standoffheader.datadesc)
-
-        profiledesc.append(datadesc.getchildren()[0])
-        profiledesc.append(datadesc.getchildren()[1])
-
-        documentheader.append(filedesc)
-        documentheader.append(profiledesc)
-
-        return documentheader
+        for child in self.render_datadesc(standoffheader.datadesc):
+            profiledesc.append(child)
+        return profiledesc
 
     def render_filedesc(self, filedesc):
         """Create an fileDesc Element.
@@ -351,12 +796,10 @@ class StandoffHeaderRenderer(object):
             SubElement(sourceDesc, 'title').text = filedesc.title
 
         if filedesc.author:
-            if 'age' in filedesc.author:
-                aut = {"age": filedesc.author['age']}
-            if 'sex' in filedesc.author:
-                aut = {"sex": filedesc.author['sex']}
+            aut = dict((key, filedesc.author[key]) for key in ('age', 'sex')
+                       if filedesc.author.get(key) is not None)
 
-            SubElement(sourceDesc, "author", aut).text = filedesc.author['name']
+            SubElement(sourceDesc, "author", aut).text = filedesc.author.get('name')
 
         if filedesc.source:
             SubElement(sourceDesc, "source",
@@ -470,11 +913,11 @@ class StandoffHeaderRenderer(object):
 
         dataDesc = Element("dataDesc")
 
-        SubElement(dataDesc, "primaryData", datadesc.primaryData)
+        SubElement(dataDesc, "primaryData", datadesc.primaryData or {})
 
         annotations = SubElement(dataDesc, "annotations")
 
-        for ann in datadesc.annotations_list:
+        for ann in datadesc.annotations_list or ():
             SubElement(annotations, "annotation", ann)
 
         return dataDesc
@@ -521,56 +964,233 @@ class StandoffHeaderRenderer(object):
 
         """
 
-        documentheader = self.render_documentheader(standoffheader)
+        # Each part of the header is written as soon as it is built
+        documentheader = self._documentheader_element(standoffheader)
+
+        output = open_file(self.outputfile, "wb")
+        try:
+            output.write(XML_DECLARATION.encode('utf-8'))
+            output.write((_start_tag(documentheader) + '\n').encode('utf-8'))
+            write_element(output, self.render_filedesc(standoffheader.filedesc), 1)
+            write_element(output, self._profiledesc_element(standoffheader), 1)
+            output.write(b'</documentHeader>\n')
+        finally:
+            output.close()
+
+
+class StandoffHeaderParser(object):
+    """
+    Reads a document header written by L{StandoffHeaderRenderer} (or any
+    GrAF document header) back into a C{StandoffHeader}, so that it can be
+    modified and rendered again.
+    """
+
+    def __init__(self, source=None):
+        """Constructor for C{StandoffHeaderParser}.
+
+        :param source: C{FileSource} to open the headers from, the file
+            system by default
+        """
+        self._source = source if source is not None else FileSource()
+
+    def parse(self, stream):
+        """Parses the document header in the given file or stream.
 
-        doc = minidom.parseString(tostring(documentheader, encoding="utf-8"))
+        :return: the header, with its fileDesc, profileDesc and dataDesc
+        :rtype: StandoffHeader
+        """
+        if hasattr(stream, 'read'):
+            header = DocumentHeader(getattr(stream, 'name', '')).load(stream)
+        else:
+            with self._source.open(stream) as f:
+                header = DocumentHeader(stream).load(f)
 
-        output = open(self.outputfile, "wb")
-        output.write(doc.toprettyxml(encoding='utf-8'))
-        output.close()
+        attributes = header.attributes
+        res = StandoffHeader(attributes.get('version', '1.0.0'),
+                             doc_id=attributes.get('docId'),
+                             creator=attributes.get('creator'),
+                             date_created=attributes.get('date.created'))
+        res.filedesc = header.filedesc
+        res.profiledesc = header.profiledesc
+        res.datadesc = header.datadesc
+        return res
 
 
 class GrAFXMLValidator(object):
+    """
+    Validates GrAF documents against the XML schemas of the standard.
+    Requires lxml; without it, documents are not validated.
 
-    def __init__(self):
-        try:
-            from lxml import etree
+    The schemas are only compiled when a document is first validated, and
+    are shared by all validators of the process.
+    """
+
+    XSD_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "xsd")
+    HEADER_XSD = os.path.join(XSD_DIR, "GrAF_DocumentHeader.xsd")
+    ANNOTATION_XSD = os.path.join(XSD_DIR, "GrAF_StandoffAnnotation.xsd")
+
+    # Compiled schemas by path
+    _schemas = {}
+    _schemas_lock = threading.Lock()
 
-            xsd_header = os.path.join(os.path.dirname(__file__), "..",
-                                      "..", "xsd", "GrAF_DocumentHeader.xsd")
-            xsd_annotation = os.path.join(os.path.dirname(__file__), "..",
-                                          "..", "xsd", "GrAF_StandoffAnnotation.xsd")
+    def __init__(self, header_xsd=None, annotation_xsd=None):
+        """Constructor for C{GrAFXMLValidator}.
 
-            self.header_xmlschema = etree.XMLSchema(etree.parse(xsd_header))
-            self.annotation_xmlschema = etree.XMLSchema(etree.parse(xsd_annotation))
+        Parameters
+        ----------
+        header_xsd : str, optional
+            Path of the schema of document headers.
+        annotation_xsd : str, optional
+            Path of the schema of annotation files.
 
-            self.import_validator = True
-        except :
-            self.import_validator = False
+        """
+        self.header_xsd = header_xsd or self.HEADER_XSD
+        self.annotation_xsd = annotation_xsd or self.ANNOTATION_XSD
+
+    @property
+    def import_validator(self):
+        """Whether lxml is available to validate documents"""
+        try:
+            import lxml.etree
+        except ImportError:
+            return False
+        return True
+
+    @classmethod
+    def get_schema(cls, path):
+        """Returns the compiled schema at the given path, compiling it on
+        first use."""
+        path = os.path.abspath(path)
+        with cls._schemas_lock:
+            try:
+                return cls._schemas[path]
+            except KeyError:
+                from lxml import etree
+                schema = cls._schemas[path] = etree.XMLSchema(etree.parse(path))
+                return schema
+
+    @property
+    def header_xmlschema(self):
+        return self.get_schema(self.header_xsd)
+
+    @property
+    def annotation_xmlschema(self):
+        return self.get_schema(self.annotation_xsd)
+
+    def _schema(self, header):
+        return self.header_xmlschema if header else self.annotation_xmlschema
 
     def validate_xml(self, context, header=False, annotation=False):
+        """Validates a whole document, given as a string or a stream.
+        Annotation files are expected unless header is True.
 
+        :raise AssertionError: if the document is invalid
+        """
         if self.import_validator:
             from lxml import etree
 
-            if header:
-                validator = self.header_xmlschema
-            elif annotation:
-                validator = self.annotation_xmlschema
-
-            doc = etree.fromstring(context)
+            validator = self._schema(header)
+            if hasattr(context, 'read'):
+                doc = etree.parse(context)
+            else:
+                doc = etree.fromstring(context)
 
             validator.assert_(doc)
 
+    def stream_validator(self, header=False):
+        """Returns a C{StreamValidator} checking a document given in chunks,
+        or None if lxml is not available."""
+        if not self.import_validator:
+            return None
+        return StreamValidator(self._schema(header))
+
+
+class StreamValidator(object):
+    """
+    Validates a document against a schema as its chunks are fed, keeping
+    only the element being parsed in memory.
+    """
+
+    def __init__(self, schema):
+        from lxml import etree
+
+        self._parser = etree.XMLPullParser(events=('end',), schema=schema)
+
+    def _discard_elements(self):
+        for _, element in self._parser.read_events():
+            element.clear()
+            # Drop the preceding siblings, already validated
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+    def feed(self, data):
+        """Validates the next chunk.
+
+        :raise lxml.etree.XMLSyntaxError: if the document is invalid
+        """
+        self._parser.feed(data)
+        self._discard_elements()
+
+    def close(self):
+        self._parser.close()
+        self._discard_elements()
+
+
+class ValidatingParser(object):
+    """
+    Wraps an incremental SAX parser so that the document it parses is
+    validated in the same pass, each chunk being fed to both.
+    """
+
+    def __init__(self, parser, validator):
+        self._parser = parser
+        self._validator = validator
+
+    def feed(self, data):
+        self._validator.feed(data)
+        self._parser.feed(data)
+
+    def close(self):
+        self._validator.close()
+        self._parser.close()
+
+    def parse(self, stream):
+        chunk = stream.read(CHUNK_SIZE)
+        while chunk:
+            self.feed(chunk)
+            chunk = stream.read(CHUNK_SIZE)
+        self.close()
+
+
 class DocumentHeader(object):
+    """
+    The document header of a GrAF document: where its annotation files and
+    primary data are, and the metadata of the header (C{filedesc},
+    C{profiledesc} and C{datadesc}, as in L{StandoffHeader}) once loaded.
+
+    Without a loaded header, annotation files are located by convention,
+    next to the given path.
+    """
+
+    # Parsed headers by path, with the modification time and size of the
+    # file they were parsed from
+    _cache = {}
+    CACHE_SIZE = 1024
 
     def __init__(self, path):
         self._basename = ""
         self._dir = ""
         self._annotationMap = {}
         self.set_basepath(path)
+        self.attributes = {}
+        self.filedesc = FileDesc()
+        self.profiledesc = ProfileDesc()
+        self.datadesc = DataDesc(None)
+        # (f.id, loc) of the annotation files, in order
+        self.annotations = []
 
     def set_basepath(self, filename):
+        filename = split_compression_ext(filename)[0]
         if filename.endswith(".txt"):
             self._basename = filename[0:-4]
             return
@@ -582,7 +1202,66 @@ class DocumentHeader(object):
         self._basename = filename
 
     def load(self, file):
-        pass
+        """Loads the header from a stream or string of XML. The header is
+        parsed as it is read, without building a document tree."""
+        parser = make_parser()
+        parser.setContentHandler(HeaderHandler(self))
+        if hasattr(file, 'read'):
+            chunk = file.read(CHUNK_SIZE)
+            while chunk:
+                parser.feed(chunk)
+                chunk = file.read(CHUNK_SIZE)
+        else:
+            parser.feed(file)
+        parser.close()
+        return self
+
+    @classmethod
+    def from_file(cls, path, stream=None):
+        """Returns the loaded header of the file at the given path.
+
+        Headers are cached, and parsed again only when the file changes,
+        so opening the header of a document several times is cheap. The
+        same object is returned while it is cached: do not modify it.
+
+        :param stream: C{file} to read the header from instead of opening
+            the path, e.g. from an archive. Headers read from streams that
+            are not files on disk are not cached.
+        """
+        key = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+            stamp = (stat.st_mtime, stat.st_size)
+        except (IOError, OSError):
+            stamp = None
+
+        if stamp is not None:
+            try:
+                cached_stamp, header = cls._cache[key]
+                if cached_stamp == stamp:
+                    return header
+            except KeyError:
+                pass
+
+        header = cls(path)
+        if stream is None:
+            with open_file(path) as stream:
+                header.load(stream)
+        else:
+            header.load(stream)
+
+        if stamp is not None:
+            if len(cls._cache) >= cls.CACHE_SIZE:
+                cls._cache.clear()
+            cls._cache[key] = (stamp, header)
+        return header
+
+    @property
+    def primary_data_loc(self):
+        """The location of the primary data, relative to the header"""
+        if self.datadesc.primaryData:
+            return self.datadesc.primaryData.get('loc') or None
+        return None
 
     def get_location(self, type):
         if len(self._annotationMap) != 0:
@@ -598,6 +1277,148 @@ class DocumentHeader(object):
         self._annotationMap[type] = loc
 
 
+class HeaderHandler(ContentHandler):
+    """
+    Reads the elements of a document header into a C{DocumentHeader}.
+    """
+
+    def __init__(self, header):
+        ContentHandler.__init__(self)
+        self._header = header
+        # (name, attributes, text chunks) of the open elements
+        self._stack = []
+        self._setting = None
+        filedesc = header.filedesc
+        profiledesc = header.profiledesc
+        self._text_fields = {
+            ('titleStmt', 'title'): (filedesc, 'titlestmt'),
+            ('sourceDesc', 'title'): (filedesc, 'title'),
+            ('sourceDesc', 'distributor'): (filedesc, 'distributor'),
+            ('sourceDesc', 'publisher'): (filedesc, 'publisher'),
+            ('sourceDesc', 'pubAddress'): (filedesc, 'pubAddress'),
+            ('sourceDesc', 'documentation'): (filedesc, 'documentation'),
+            ('textClass', 'subject'): (profiledesc, 'subject'),
+            ('textClass', 'domain'): (profiledesc, 'domain'),
+            ('textClass', 'subdomain'): (profiledesc, 'subdomain'),
+        }
+        self._end_handlers = {
+            'documentHeader': self.header_end,
+            'extent': self.extent_end,
+            'author': self.author_end,
+            'source': self.source_end,
+            'eAddress': self.eaddress_end,
+            'pubDate': self.pubdate_end,
+            'idno': self.idno_end,
+            'pubName': self.pubname_end,
+            'language': self.language_end,
+            'textClass': self.textclass_end,
+            'person': self.person_end,
+            'setting': self.setting_end,
+            'time': self.setting_field_end,
+            'activity': self.setting_field_end,
+            'locale': self.setting_field_end,
+            'primaryData': self.primarydata_end,
+            'annotation': self.annotation_end,
+        }
+
+    def startElement(self, name, attrs):
+        self._stack.append((name, dict(attrs), []))
+        if name == 'setting':
+            self._setting = {'who': attrs.get('who')}
+
+    def characters(self, ch):
+        if self._stack:
+            self._stack[-1][2].append(ch)
+
+    def endElement(self, name):
+        name, attrs, text = self._stack.pop()
+        text = ''.join(text).strip() or None
+        parent = self._stack[-1][0] if self._stack else None
+        try:
+            obj, field = self._text_fields[parent, name]
+        except KeyError:
+            handler = self._end_handlers.get(name)
+            if handler is not None:
+                handler(name, attrs, text)
+        else:
+            setattr(obj, field, text)
+
+    def header_end(self, name, attrs, text):
+        self._header.attributes = attrs
+
+    # fileDesc
+
+    def extent_end(self, name, attrs, text):
+        self._header.filedesc.extent = {'unit': attrs.get('unit'),
+                                        'count': attrs.get('count')}
+
+    def author_end(self, name, attrs, text):
+        author = dict(attrs)
+        author['name'] = text
+        self._header.filedesc.author = author
+
+    def source_end(self, name, attrs, text):
+        self._header.filedesc.source = {'type': attrs.get('type'),
+                                        'source': text}
+
+    def eaddress_end(self, name, attrs, text):
+        self._header.filedesc.eAddress = {'type': attrs.get('type'),
+                                          'email': text}
+
+    def pubdate_end(self, name, attrs, text):
+        self._header.filedesc.pubDate = attrs.get('iso8601', text)
+
+    def idno_end(self, name, attrs, text):
+        self._header.filedesc.idno = {'type': attrs.get('type'),
+                                      'number': text}
+
+    def pubname_end(self, name, attrs, text):
+        self._header.filedesc.pubName = {'type': attrs.get('type'),
+                                         'text': text}
+
+    # profileDesc
+
+    def language_end(self, name, attrs, text):
+        profiledesc = self._header.profiledesc
+        if profiledesc.languages is None:
+            profiledesc.languages = []
+        profiledesc.add_language(attrs.get('iso639'))
+
+    def textclass_end(self, name, attrs, text):
+        self._header.profiledesc.catRef = attrs.get('catRef')
+
+    def person_end(self, name, attrs, text):
+        profiledesc = self._header.profiledesc
+        if profiledesc.participants is None:
+            profiledesc.participants = []
+        profiledesc.participants.append(attrs)
+
+    def setting_field_end(self, name, attrs, text):
+        if self._setting is not None:
+            self._setting[name] = text
+
+    def setting_end(self, name, attrs, text):
+        profiledesc = self._header.profiledesc
+        if profiledesc.settings is None:
+            profiledesc.settings = []
+        setting = self._setting
+        profiledesc.add_setting(setting.get('who'), setting.get('time'),
+                                setting.get('activity'), setting.get('locale'))
+        self._setting = None
+
+    # dataDesc
+
+    def primarydata_end(self, name, attrs, text):
+        self._header.datadesc.primaryData = attrs
+
+    def annotation_end(self, name, attrs, text):
+        fid, loc = attrs.get('f.id'), attrs.get('loc')
+        self._header.datadesc.add_annotation(loc, fid,
+                                             attrs.get('loctype', 'relative'))
+        self._header.annotations.append((fid, loc))
+        self._header.add_type(fid, loc)
+
+
 class SAXHandler(ContentHandler):
     ERR_MODE_RAISE = 'error'
     ERR_MODE_IGNORE = 'ignore'
@@ -662,7 +1483,8 @@ class SAXHandler(ContentHandler):
 
 
 class GraphHandler(SAXHandler):
-    def __init__(self, parser, graph, parse_dependency, parse_anchor=CharAnchor, constants=Constants):
+    def __init__(self, parser, graph, parse_dependency, parse_anchor=CharAnchor, constants=Constants,
+                 lazy_features=False, feature_pool=None, layer=None):
         SAXHandler.__init__(self, {
             constants.GRAPH: (None, self.graph_end),
             # Header
@@ -689,19 +1511,33 @@ class GraphHandler(SAXHandler):
             constants.FS: (self.fs_start, self.fs_end),
             constants.FEATURE: (self.feature_start, self.feature_end, self.feature_chars),
         })
+        if lazy_features:
+            # Feature structures are kept as records of interned strings
+            # and built on first access to Annotation.features
+            self._start_handlers[constants.FS] = self.raw_fs_start
+            self._end_handlers[constants.FS] = self.raw_fs_end
+            self._start_handlers[constants.FEATURE] = self.raw_feature_start
+            self._end_handlers[constants.FEATURE] = self.raw_feature_end
+            self._char_handlers[constants.FEATURE] = self.raw_feature_chars
 
         self._parser = parser
         self.graph = graph
         self._g = constants
         self._parse_dependency = parse_dependency
         self._parse_anchor = parse_anchor
+        # f.id of the parsed file, if known
+        self._layer = layer
 
         self._cur_node = None
         self._delayed_links = []
 
         self._cur_annot = None
+        self._feature_pool = feature_pool
         self._fs_stack = []
         self._feat_name_stack = []
+        # Text chunks of the open features, None for those containing a
+        # feature structure
+        self._feat_text_stack = []
         self._aspace_stack = []
         self._default_aspace_id = None
 
@@ -721,6 +1557,8 @@ class GraphHandler(SAXHandler):
 
         if as_id not in self.graph.annotation_spaces:
             self.graph.annotation_spaces.create(as_id)
+        if self._layer is not None:
+            self.graph.header.layers.setdefault(as_id, self._layer)
 
         if is_default:
             self._default_aspace_id = as_id
@@ -777,6 +1615,14 @@ class GraphHandler(SAXHandler):
         aspace.add(self._cur_annot)
 
     def annot_end(self):
+        pool = self._feature_pool
+        if pool is not None:
+            # Share identical feature structures (or their records)
+            annot = self._cur_annot
+            if annot._raw_features is not None:
+                annot._raw_features = pool.setdefault(annot._raw_features, annot._raw_features)
+            elif annot._features is not None:
+                annot.features = annot._features.freeze(pool)
         self._cur_annot = None
 
     def fs_start(self, attribs):
@@ -785,6 +1631,8 @@ class GraphHandler(SAXHandler):
             fs = FeatureStructure(type_)
             self._fs_stack[-1][self._feat_name_stack[-1]] = fs
             self._fs_stack.append(fs)
+            # The whitespace around it is not the value of the feature
+            self._feat_text_stack[-1] = None
         else:
             self._cur_annot.features.type = type_
             self._fs_stack.append(self._cur_annot.features)
@@ -801,14 +1649,60 @@ class GraphHandler(SAXHandler):
             value = ""
 
         self._feat_name_stack.append(name)
+        self._feat_text_stack.append([])
         self._fs_stack[-1][name] = value
 
     def feature_end(self):
-        self._feat_name_stack.pop()
+        name = self._feat_name_stack.pop()
+        # The text may come in several chunks
+        text = self._feat_text_stack.pop()
+        if text:
+            self._fs_stack[-1][name] = ''.join(text)
 
     def feature_chars(self, value):
-        name = self._feat_name_stack[-1]
-        self._fs_stack[-1][name] = value
+        text = self._feat_text_stack[-1]
+        if text is not None:
+            text.append(value)
+
+    # Lazy feature structures: the stack holds [type, items] lists that
+    # are turned into (type, items) records when their element ends
+
+    def raw_fs_start(self, attribs):
+        self._fs_stack.append([attribs.get(self._g.TYPE, None), []])
+        if len(self._fs_stack) > 1:
+            self._feat_text_stack[-1] = None
+
+    def raw_fs_end(self):
+        type_, items = self._fs_stack.pop()
+        record = (type_, tuple(items))
+        if self._fs_stack:
+            parent = self._fs_stack[-1][1]
+            parent[-1] = (parent[-1][0], record)
+        else:
+            annot = self._cur_annot
+            previous = annot._raw_features
+            if previous is None:
+                annot._raw_features = record
+            else:
+                annot._raw_features = (type_, previous[1] + record[1])
+
+    def raw_feature_start(self, attribs):
+        value = attribs.get(self._g.VALUE)
+        if value is not None:
+            value = intern(value)
+        self._fs_stack[-1][1].append((intern(attribs.get(self._g.NAME)), value))
+        self._feat_text_stack.append([])
+
+    def raw_feature_end(self):
+        text = self._feat_text_stack.pop()
+        if text:
+            items = self._fs_stack[-1][1]
+            items[-1] = (items[-1][0], intern(''.join(text)))
+
+    def raw_feature_chars(self, value):
+        text = self._feat_text_stack[-1]
+        if text is not None:
+            text.append(value)
 
     def aspace_enter(self, attribs):
         self._aspace_stack.append(self.graph.annotation_spaces[attribs[self._g.NAME]])
@@ -830,12 +1724,129 @@ class GraphParser(object):
 
     """
 
-    def __init__(self, get_dependency=None, parse_anchor=CharAnchor, constants=Constants):
+    def __init__(self, get_dependency=None, parse_anchor=CharAnchor, constants=Constants,
+                 source=None, lazy_features=False, intern_features=False,
+                 validate=False):
+        """Constructor for C{GraphParser}.
+
+        Parameters
+        ----------
+        get_dependency : function, optional
+            Returns a stream for the annotation file of the given
+            dependency name. By default dependencies are resolved next to
+            the parsed file.
+        parse_anchor : function, optional
+            Converts the string anchors of regions.
+        constants : class, optional
+            The element and attribute names to parse.
+        source : graf.io.FileSource, optional
+            Where to open all files from, e.g. a C{ZipSource} to parse
+            the members of an archive in place. Defaults to the file
+            system.
+        lazy_features : bool, optional
+            Whether to keep the feature structures of annotations in a
+            compact form and only build them when C{Annotation.features}
+            is first accessed. Saves time and memory when most features
+            are never read, e.g. when only labels are used.
+        intern_features : bool or dict, optional
+            Whether to make the feature structures of annotations frozen
+            and share identical ones between annotations, which saves
+            memory when many annotations have the same features. A dict
+            may be given as the pool of shared structures, e.g. to share
+            them between parsers; otherwise the parser keeps one pool for
+            all the files it parses. With lazy_features, the compact forms
+            are shared instead, and the structures built from them are
+            not.
+        validate : bool, optional
+            Whether to validate the parsed files against the GrAF schemas,
+            which requires lxml: an ImportError is raised without it.
+            Annotation files are validated as they are parsed, in the same
+            pass.
+
+        """
         self._g = constants
         self._get_dep = get_dependency
+        self._source = source if source is not None else FileSource()
         self._parse_anchor = parse_anchor
+        self._lazy_features = lazy_features
+        if intern_features is None or intern_features is False:
+            self._feature_pool = None
+        elif intern_features is True:
+            self._feature_pool = {}
+        elif isinstance(intern_features, dict):
+            self._feature_pool = intern_features
+        else:
+            raise TypeError('intern_features must be a bool or a dict, not %r'
+                            % type(intern_features).__name__)
         self._parsed_deps = None
+        self._feed_parser = None
+        self._feed_graph = None
+        self._validate = validate
         self.graf_validator = GrAFXMLValidator()
+        if validate and not self.graf_validator.import_validator:
+            raise ImportError('lxml is required to validate the parsed files')
+
+    def _read_header(self, filename, stream):
+        """Returns the C{DocumentHeader} of the given header file, from the
+        cache if it has not changed."""
+        if self._validate:
+            context = stream.read()
+            self.graf_validator.validate_xml(context, header=True)
+            return DocumentHeader(filename).load(context)
+        if isinstance(self._source, ArchiveSource):
+            return DocumentHeader(filename).load(stream)
+        return DocumentHeader.from_file(filename, stream)
+
+    def _primary_data(self, filename, loc):
+        """Returns a C{PrimaryData} for the primary data file at the given
+        location relative to the header, or None if there is none."""
+        source = self._source
+        if loc is None:
+            return None
+        path = source.join(source.dirname(filename), loc)
+        if not source.exists(path):
+            return None
+        # The offset index is kept in memory rather than written into
+        # the corpus directory
+        if os.path.exists(path) and not isinstance(source, ArchiveSource):
+            return PrimaryData(path, cache=False)
+        return PrimaryData(path, cache=False, source=source)
+
+    def _dependency_locator(self, filename, header=None):
+        """Returns a function that maps a dependency name to the path of
+        its file in the parser's source: relative to the header's directory
+        when parsing the given C{DocumentHeader}, otherwise derived from
+        the name of the annotation file."""
+        source = self._source
+        if header is not None:
+            dirname = source.dirname(filename)
+
+            def locate(name):
+                return source.join(dirname, header.get_location(name))
+        else:
+            header = DocumentHeader(source.normalize(filename))
+
+            def locate(name):
+                return header.get_location(name)
+
+        return locate
+
+    def _create_sax_parser(self, graph, parse_dependency, layer=None):
+        """Returns an incremental SAX parser that adds the elements it
+        parses to the given graph. The annotation spaces declared in the
+        file are recorded as read from the given layer (f.id), if any."""
+        parser = make_parser()
+        handler = GraphHandler(parser, graph, parse_dependency,
+                               parse_anchor=self._parse_anchor,
+                               constants=self._g,
+                               lazy_features=self._lazy_features,
+                               feature_pool=self._feature_pool,
+                               layer=layer)
+        parser.setContentHandler(handler)
+        if self._validate:
+            return ValidatingParser(parser,
+                                    self.graf_validator.stream_validator())
+        return parser
 
     def parse(self, stream, graph=None):
         """Parses the XML file at the given path.
@@ -844,87 +1855,159 @@ class GraphParser(object):
         :rtype: Graph
         """
 
-        def open_file_for_parse(filename):
-            if sys.version_info[:2] >= (3, 0):
-                return codecs.open(filename, "r", "utf-8")
-            else:
-                return open(filename, "r")
-
-        def do_parse(stream, graph):
-            filename = stream.name
-            context = stream.read()
-            #self.graf_validator.validate_xml(context, annotation="True")
+        source = self._source
 
-            parser = make_parser()
-            handler = GraphHandler(parser, graph, parse_dependency,
-                                   parse_anchor=self._parse_anchor,
-                                   constants=self._g)
-            parser.setContentHandler(handler)
-            parser.parse(filename)
+        def do_parse(stream, graph, layer=None):
+            parser = self._create_sax_parser(graph, parse_dependency, layer)
+            parser.parse(stream)
 
         def parse_dependency(name, graph):
             if name in parsed_deps:
                 return
             parsed_deps.add(name)
-            do_parse(get_dependency(name), graph)
-
-        if not hasattr(stream, 'read'):
-            stream = open_file_for_parse(stream)
+            if name in parsed_layers:
+                return
+            stream = get_dependency(name)
+            do_parse(stream, graph, name)
+            if get_dependency is open_dependency:
+                stream.close()
+
+        def open_dependency(name):
+            return source.open(locate(name))
+
+        opened = not hasattr(stream, 'read')
+        if opened:
+            filename = stream
+            stream = source.open(filename)
+        else:
+            filename = stream.name
 
         parsed_deps = set()
-        extension = os.path.splitext(stream.name)[1][1:]
+        parsed_layers = set()
+        extension = os.path.splitext(split_compression_ext(filename)[0])[1][1:]
 
         if extension == 'hdr':
-            context = stream.read()
-            #self.graf_validator.validate_xml(context, header=True)
-
-            doc_header = minidom.parseString(context)
-            dirname = os.path.dirname(stream.name)
+            header = self._read_header(filename, stream)
+            dirname = source.dirname(filename)
 
             if self._get_dep:
                 get_dependency = self._get_dep
             else:
-                header = DocumentHeader(stream.name)
-                for annotation in doc_header.getElementsByTagName('annotation'):
-                    loc = annotation.getAttribute('loc')
-                    fid = annotation.getAttribute('f.id')
-                    header.add_type(fid, loc)
-
-                def get_dependency(name):
-                    return open_file_for_parse(os.path.join(dirname, header.get_location(name)))
-
-
-            for annotation in doc_header.getElementsByTagName('annotation'):
-                loc = annotation.getAttribute('loc')
-                fid = annotation.getAttribute('f.id')
+                locate = self._dependency_locator(filename, header)
+                get_dependency = open_dependency
 
+            for fid, loc in header.annotations:
                 if fid in parsed_deps:
                     continue
+                # Not parsed again when another layer depends on it
+                parsed_layers.add(fid)
 
                 if graph is None:
                     graph = Graph()
 
-                stream = open_file_for_parse(os.path.join(dirname, loc))
-                do_parse(stream, graph)
+                with source.open(source.join(dirname, loc)) as layer:
+                    do_parse(layer, graph, fid)
+
+            if graph is not None and graph.primary_data is None:
+                graph.primary_data = self._primary_data(
+                    filename, header.primary_data_loc)
         else:
             if self._get_dep:
                 get_dependency = self._get_dep
             else:
                 # Default get_dependency is relative to path
-                header = DocumentHeader(os.path.abspath(stream.name))
-
-                def get_dependency(name):
-                    return open_file_for_parse(header.get_location(name))
+                locate = self._dependency_locator(filename)
+                get_dependency = open_dependency
 
             if graph is None:
                 graph = Graph()
 
             do_parse(stream, graph)
 
+        if opened:
+            stream.close()
+
         self._parsed_deps = parsed_deps
 
         return graph
 
+    def feed(self, data, graph=None):
+        """Feeds a chunk of an annotation file to the parser. The graph is
+        built progressively as the chunks arrive, so the whole document
+        never has to be held in memory. Call L{close} after the last chunk
+        to get the graph.
+
+        Dependencies are parsed with the get_dependency function given to
+        the constructor. A document with dependencies cannot be fed without
+        one, as there is no file name to resolve them against.
+
+        If the document cannot be parsed, the error is raised and the
+        parser is reset, so that the next chunk starts a new document.
+
+        Parameters
+        ----------
+        data : bytes or str
+            The next chunk of the document.
+        graph : graf.Graph, optional
+            The graph to add the parsed elements to. Only used with the
+            first chunk of a document; a new graph is created if None.
+
+        """
+        if self._feed_parser is None:
+            if graph is None:
+                graph = Graph()
+            parsed_deps = set()
+            get_dependency = self._get_dep
+
+            def parse_dependency(name, graph):
+                if name in parsed_deps:
+                    return
+                if get_dependency is None:
+                    raise ValueError('Cannot parse the dependency %r of a fed '
+                                     'document without a get_dependency '
+                                     'function' % name)
+                parsed_deps.add(name)
+                self._create_sax_parser(graph, parse_dependency).parse(
+                    get_dependency(name))
+
+            self._parsed_deps = parsed_deps
+            self._feed_graph = graph
+            self._feed_parser = self._create_sax_parser(graph, parse_dependency)
+
+        try:
+            self._feed_parser.feed(data)
+        except Exception:
+            self._feed_parser = self._feed_graph = None
+            raise
+
+    def close(self):
+        """Finishes the document fed with L{feed}.
+
+        :return: the Graph built from the fed chunks
+        :rtype: Graph
+        """
+        if self._feed_parser is None:
+            raise ValueError('No data has been fed to the parser')
+
+        parser, graph = self._feed_parser, self._feed_graph
+        self._feed_parser = self._feed_graph = None
+        parser.close()
+        return graph
+
+    def parse_async(self, stream, graph=None, executor=None):
+        """Returns a coroutine that parses the given file like L{parse}.
+
+        All files are read in the given C{concurrent.futures} thread pool
+        (the event loop's default executor if None), the annotation files
+        of a header and their dependencies concurrently, and then parsed
+        there, so that many documents can be loaded by a single event loop
+        without blocking it. Requires Python 3.7+.
+
+        :return: a coroutine resolving to a Graph
+        """
+        from graf.aio import parse_async
+        return parse_async(self, stream, graph, executor)
+
 
 if __name__ == '__main__':
     # Round-trip
@@ -7,6 +7,13 @@
 # For license information, see LICENSE.TXT
 #
 
+import bisect
+import codecs
+import mmap
+import os
+import zlib
+from array import array
+
 # Note: Python Anchor objects:
 # * are immutable
 # * provide __lt__, __eq__, __add__ and __sub__
@@ -39,6 +46,15 @@ class Region(object):
     def __repr__(self):
         return "RegionID = " + self.id
 
+    def __getstate__(self):
+        # The back-references to nodes are restored by Node.__setstate__ or
+        # by Graph.__setstate__
+        return self.id, self.anchors
+
+    def __setstate__(self, state):
+        self.id, self.anchors = state
+        self.nodes = []
+
     def __iadd__(self, offset):
         for i in range(len(self.anchors)):
             self.anchors[i] += offset
@@ -72,3 +88,223 @@ class Region(object):
     @start.setter
     def start(self, val):
         self.anchors[0] = val
+
+
+class PrimaryData(object):
+    """
+    Access to the primary text of a document, i.e. the text that the
+    character anchors of regions point into.
+
+    The text file is memory-mapped instead of read into memory, and a
+    sampled index of the byte offset of every C{sample}th character is
+    built once (and cached on disk next to the text), so that the text
+    of any region is found in constant time whatever the encoding.
+    """
+
+    # Bytes read from the file at a time while building the index
+    CHUNK_SIZE = 1024 * 1024
+    # Maximal number of bytes per character in the supported encodings
+    MAX_CHAR_BYTES = 4
+    INDEX_EXT = '.idx'
+    _INDEX_FORMAT = 1
+    _INDEX_HEADER = 5
+
+    def __init__(self, filename, encoding='utf-8', sample=64, cache=True,
+                 source=None):
+        """Constructor for C{PrimaryData}.
+
+        Parameters
+        ----------
+        filename : str
+            Path of the primary text file.
+        encoding : str
+            Encoding of the text file.
+        sample : int
+            Number of characters between two entries of the offset index.
+            Smaller values make lookups faster and the index larger.
+        cache : bool
+            Whether to store the offset index in a file next to the text
+            and reuse it while the text does not change.
+        source : FileSource, optional
+            The source the file is opened from, e.g. a L{graf.io.ZipSource}
+            for files in archives. The text is then read into memory
+            instead of memory-mapped, and the index is never cached.
+
+        """
+        self.filename = filename
+        self.encoding = encoding
+        self.sample = sample
+        self.cache = cache and source is None
+        self.source = source
+        self._data = None
+        self._offsets = None
+        self._length = None
+
+    def __repr__(self):
+        return "PrimaryData(%r)" % self.filename
+
+    def __getstate__(self):
+        return (self.filename, self.encoding, self.sample, self.cache,
+                self.source)
+
+    def __setstate__(self, state):
+        (self.filename, self.encoding, self.sample, self.cache,
+         self.source) = state
+        self._data = self._offsets = self._length = None
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = None
+
+    # Loading
+
+    @property
+    def data(self):
+        """The encoded text, as a memory map or bytes"""
+        if self._data is None:
+            if self.source is not None:
+                stream = self.source.open(self.filename)
+                try:
+                    self._data = stream.read()
+                finally:
+                    stream.close()
+            else:
+                with open(self.filename, 'rb') as f:
+                    if os.fstat(f.fileno()).st_size == 0:
+                        self._data = b''
+                    else:
+                        self._data = mmap.mmap(f.fileno(), 0,
+                                               access=mmap.ACCESS_READ)
+        return self._data
+
+    @property
+    def offsets(self):
+        """The byte offsets of every C{sample}th character"""
+        if self._offsets is None:
+            if not (self.cache and self._load_index()):
+                self._build_index()
+                if self.cache:
+                    self._save_index()
+        return self._offsets
+
+    def _index_header(self):
+        stat = os.stat(self.filename)
+        return [self._INDEX_FORMAT, self.sample, stat.st_size,
+                int(stat.st_mtime * 1000000),
+                zlib.crc32(codecs.lookup(self.encoding).name.encode('ascii'))]
+
+    def _load_index(self):
+        index = array('q')
+        try:
+            with open(self.filename + self.INDEX_EXT, 'rb') as f:
+                index.fromfile(f, self._INDEX_HEADER + 1)
+                if list(index[:self._INDEX_HEADER]) != self._index_header():
+                    return False
+                self._length = index[self._INDEX_HEADER]
+                offsets = array('q')
+                count = (os.fstat(f.fileno()).st_size // offsets.itemsize -
+                         len(index))
+                offsets.fromfile(f, count)
+        except (IOError, OSError, EOFError):
+            return False
+        self._offsets = offsets
+        return True
+
+    def _save_index(self):
+        index = array('q', self._index_header() + [self._length])
+        try:
+            with open(self.filename + self.INDEX_EXT, 'wb') as f:
+                index.tofile(f)
+                self._offsets.tofile(f)
+        except (IOError, OSError):
+            pass
+
+    def _build_index(self):
+        data = self.data
+        encoding = self.encoding
+        sample = self.sample
+        decoder = codecs.getincrementaldecoder(encoding)()
+        offsets = array('q', [0])
+
+        # Character and byte offsets of the start of the decoded chunk
+        char_pos = byte_pos = 0
+        next_sample = sample
+        for start in range(0, len(data), self.CHUNK_SIZE):
+            chunk = data[start:start + self.CHUNK_SIZE]
+            final = start + self.CHUNK_SIZE >= len(data)
+            text = decoder.decode(chunk, final)
+            end_pos = start + len(chunk) - len(decoder.getstate()[0])
+
+            if end_pos - byte_pos == len(text):
+                # One byte per character
+                while next_sample <= char_pos + len(text):
+                    offsets.append(byte_pos + next_sample - char_pos)
+                    next_sample += sample
+            else:
+                i, offset = 0, byte_pos
+                while next_sample <= char_pos + len(text):
+                    j = next_sample - char_pos
+                    offset += len(text[i:j].encode(encoding))
+                    offsets.append(offset)
+                    i = j
+                    next_sample += sample
+
+            char_pos += len(text)
+            byte_pos = end_pos
+
+        self._offsets = offsets
+        self._length = char_pos
+
+    # Access
+
+    def __len__(self):
+        """Returns the length of the text in characters"""
+        self.offsets
+        return self._length
+
+    def _decode_prefix(self, start, nbytes):
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        return decoder.decode(self.data[start:start + nbytes])
+
+    def char_to_byte(self, pos):
+        """Returns the byte offset of the character at the given position"""
+        offsets = self.offsets
+        if pos < 0 or pos > self._length:
+            raise IndexError('Character offset %r out of range' % pos)
+        block, rest = divmod(pos, self.sample)
+        start = offsets[block]
+        if rest == 0:
+            return start
+        text = self._decode_prefix(start, rest * self.MAX_CHAR_BYTES)
+        return start + len(text[:rest].encode(self.encoding))
+
+    def byte_to_char(self, offset):
+        """Returns the position of the character starting at (or containing)
+        the given byte offset"""
+        offsets = self.offsets
+        if offset < 0 or offset > len(self.data):
+            raise IndexError('Byte offset %r out of range' % offset)
+        block = bisect.bisect_right(offsets, offset) - 1
+        start = offsets[block]
+        return block * self.sample + len(
+            self._decode_prefix(start, offset - start))
+
+    def text(self, start, end):
+        """Returns the text between the given character offsets"""
+        start_byte = self.char_to_byte(start)
+        end_byte = self.char_to_byte(end)
+        return self.data[start_byte:end_byte].decode(self.encoding)
+
+    def region_text(self, region):
+        """Returns the text covered by the given C{Region}"""
+        return self.text(region.start, region.end)
+
+    def __getitem__(self, sl):
+        if isinstance(sl, slice):
+            if sl.step not in (None, 1):
+                raise ValueError('PrimaryData slices do not support steps')
+            start = 0 if sl.start is None else sl.start
+            end = len(self) if sl.stop is None else sl.stop
+            return self.text(start, end)
+        return self.text(sl, sl + 1)
@@ -0,0 +1,471 @@
+# graf-python: Python GrAF API
+#
+# Copyright (C) 2014 American National Corpus
+# Author: Keith Suderman <suderman@cs.vassar.edu> (Original API)
+#         Stephen Matysik <smatysik@gmail.com> (Conversion to Python)
+# URL: <http://www.anc.org/>
+# For license information, see LICENSE.TXT
+#
+
+"""
+Rendering of many graphs in parallel worker processes, and of a graph
+split into layers: one annotation file per annotation space (or group of
+annotation spaces), which depends on the layers defining the elements it
+refers to, and a document header listing them, as in the GrAF corpora
+read by L{GraphParser}.
+"""
+
+import filecmp
+import multiprocessing
+import os
+
+from graf.graphs import Edge, GraphHeader, StandoffHeader
+from graf.io import GrafRenderer, StandoffHeaderParser, \
+    StandoffHeaderRenderer, split_compression_ext
+
+
+class GraphLayer(object):
+    """
+    The part of a graph written to one annotation file: the regions, nodes
+    and edges it defines, the annotations in its annotation spaces and the
+    names of the layers it depends on. It has the attributes of a C{Graph}
+    read by L{GrafRenderer}, so it is rendered like a graph.
+    """
+
+    def __init__(self, name, graph):
+        """Constructor for C{GraphLayer}.
+
+        :param name: C{str}, the f.id of the layer file
+        :param graph: C{Graph} the layer is part of
+
+        """
+        self.name = name
+        self.graph = graph
+        self.header = GraphHeader()
+        self.annotation_spaces = []
+        self.regions = []
+        self.nodes = []
+        self.edges = []
+        # Annotations in this layer of elements defined by other layers
+        self.external_annotations = []
+        self._as_ids = set()
+
+    def __repr__(self):
+        return "GraphLayer(%r)" % self.name
+
+    @property
+    def depends_on(self):
+        return self.header.depends_on
+
+    def iter_annotations(self, element):
+        """Generates the annotations of the given element of this layer
+        that are in the layer. Annotations outside of any annotation space
+        go with their element."""
+        as_ids = self._as_ids
+        return (a for a in element.annotations
+                if a.aspace is None or a.aspace.as_id in as_ids)
+
+
+def _annotation_layer(element, index):
+    """The first layer with annotations of the given element, or None"""
+    found = [index[a.aspace.as_id] for a in element.annotations
+             if a.aspace is not None]
+    return min(found) if found else None
+
+
+def split_layers(graph, layers=None):
+    """Splits a graph into layers, each defining the elements annotated in
+    its annotation spaces.
+
+    A node or edge is defined by the first layer that annotates it. A node
+    without annotations goes with the first layer of its annotated edges
+    or neighbours, an edge without annotations with the last layer of its
+    nodes, and a region with the first layer of the nodes linked to it.
+    Elements that are connected to nothing annotated go in the first layer.
+    As the layers are ordered like the annotation spaces of the graph, e.g.
+    in the order their files were parsed, they depend on earlier layers
+    only.
+
+    Parameters
+    ----------
+    graph : Graph
+        The graph to split.
+    layers : dict, optional
+        Maps annotation space ids to layer names, to put several annotation
+        spaces in one layer. The other annotation spaces are layers of
+        their own, named after them. By default, the annotation spaces of
+        a parsed graph are put in the layer (f.id) of the file they were
+        read from, see C{GraphHeader.layers}.
+
+    Returns
+    -------
+    res : list of GraphLayer
+        In the order of the annotation spaces of the graph.
+
+    """
+    if layers is None:
+        layers = graph.header.layers
+    res = []
+    by_name = {}
+    # Annotation space id -> index of its layer
+    index = {}
+    for aspace in graph.annotation_spaces:
+        name = layers.get(aspace.as_id, aspace.as_id)
+        if name not in by_name:
+            by_name[name] = len(res)
+            res.append(GraphLayer(name, graph))
+        layer = res[by_name[name]]
+        layer.annotation_spaces.append(aspace)
+        layer._as_ids.add(aspace.as_id)
+        index[aspace.as_id] = by_name[name]
+    if not res:
+        raise ValueError('The graph has no annotation spaces to split by')
+
+    node_layer = {}
+    edge_layer = {}
+    for node in graph.nodes:
+        found = _annotation_layer(node, index)
+        if found is not None:
+            node_layer[node.id] = found
+    for edge in graph.edges:
+        found = _annotation_layer(edge, index)
+        if found is not None:
+            edge_layer[edge.id] = found
+
+    unannotated = {}
+    for node in graph.nodes:
+        if node.id in node_layer:
+            continue
+        found = []
+        for edges, end in ((node.in_edges, 'from_node'),
+                           (node.out_edges, 'to_node')):
+            for edge in edges:
+                if edge.id in edge_layer:
+                    found.append(edge_layer[edge.id])
+                other = getattr(edge, end).id
+                if other in node_layer:
+                    found.append(node_layer[other])
+        unannotated[node.id] = min(found) if found else 0
+    node_layer.update(unannotated)
+
+    for edge in graph.edges:
+        if edge.id not in edge_layer:
+            edge_layer[edge.id] = max(node_layer.get(edge.from_node.id, 0),
+                                      node_layer.get(edge.to_node.id, 0))
+
+    region_layer = {}
+    for region in graph.regions:
+        found = [node_layer[node.id] for node in region.nodes
+                 if node.id in node_layer]
+        region_layer[region.id] = min(found) if found else 0
+
+    dependencies = [set() for layer in res]
+    for region in graph.regions:
+        res[region_layer[region.id]].regions.append(region)
+    for node in graph.nodes:
+        owner = node_layer[node.id]
+        res[owner].nodes.append(node)
+        for link in node.links:
+            for region in link:
+                dependencies[owner].add(region_layer.get(region.id, owner))
+    for edge in graph.edges:
+        owner = edge_layer[edge.id]
+        res[owner].edges.append(edge)
+        for node in (edge.from_node, edge.to_node):
+            dependencies[owner].add(node_layer.get(node.id, owner))
+
+    for aspace in graph.annotation_spaces:
+        i = index[aspace.as_id]
+        for a in aspace:
+            if isinstance(a.element, Edge):
+                owner = edge_layer.get(a.element.id)
+            else:
+                owner = node_layer.get(a.element.id)
+            if owner != i:
+                res[i].external_annotations.append(a)
+                if owner is not None:
+                    dependencies[i].add(owner)
+
+    for root in graph.header.roots:
+        if root in node_layer:
+            res[node_layer[root]].header.roots.append(root)
+    for i, layer in enumerate(res):
+        dependencies[i].discard(i)
+        layer.header.depends_on = [res[j].name
+                                   for j in sorted(dependencies[i])]
+    return res
+
+
+def layer_filename(header_file, name):
+    """Returns the path of the file of the given layer next to a document
+    header, named like the layers of the GrAF corpora
+    (e.g. doc-word.xml for the layer word or f.word of doc.hdr)."""
+    base = os.path.splitext(split_compression_ext(header_file)[0])[0]
+    if name.startswith('f.'):
+        name = name[2:]
+    return '%s-%s.xml' % (base, name)
+
+
+def _replace(src, dst):
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def _write_if_changed(render, outputfile):
+    """Renders to a temporary file with render(path), and replaces the
+    given file with it only if their contents differ, so that unchanged
+    files keep their modification time. Returns True if the file was
+    written."""
+    dirname, basename = os.path.split(outputfile)
+    # The extension is kept, as it selects the compression
+    tmp = os.path.join(dirname, '.tmp-' + basename)
+    try:
+        render(tmp)
+        if (os.path.exists(outputfile) and
+                filecmp.cmp(tmp, outputfile, shallow=False)):
+            return False
+        _replace(tmp, outputfile)
+        return True
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _render(args):
+    graph, outputfile, order = args
+    GrafRenderer(outputfile, order).render(graph)
+    return outputfile
+
+
+def _map(function, tasks, jobs, initializer=None, initargs=()):
+    """Maps the function over the tasks in a pool of worker processes, or
+    in this process if jobs is 1. The initializer only sets up the worker
+    processes."""
+    if jobs == 1:
+        return [function(task) for task in tasks]
+    pool = multiprocessing.Pool(jobs, initializer, initargs)
+    try:
+        return list(pool.imap_unordered(function, tasks, 4))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def render_graphs(graphs, jobs=None, order=GrafRenderer.SORTED):
+    """Renders many graphs to their own files in parallel worker processes.
+
+    Parameters
+    ----------
+    graphs : iterable
+        Pairs of a C{Graph} and the path of the file to write it to. The
+        graphs are pickled to the workers.
+    jobs : int, optional
+        Number of worker processes; the number of CPUs by default. The
+        graphs are rendered in this process if 1.
+    order : str
+        Order of the elements in the files, see L{GrafRenderer}.
+
+    Returns
+    -------
+    res : list of str
+        The paths of the written files, in the order they were written.
+
+    """
+    return _map(_render, ((graph, outputfile, order)
+                          for graph, outputfile in graphs), jobs)
+
+
+# The layers rendered by a worker process
+_worker_layers = None
+
+
+def _init_layer_worker(graph, layers):
+    # Each worker splits the graph again rather than receiving the layers,
+    # which would be pickled apart from the graph
+    global _worker_layers
+    _worker_layers = split_layers(graph, layers)
+
+
+def _render_layer(split, args):
+    i, outputfile, order = args
+
+    def render(path):
+        GrafRenderer(path, order).render(split[i])
+
+    if _write_if_changed(render, outputfile):
+        return outputfile
+    return None
+
+
+def _render_worker_layer(args):
+    return _render_layer(_worker_layers, args)
+
+
+def _render_split(graph, layers, split, tasks, jobs):
+    """Renders the layers of the tasks, given as (index in split, output
+    file, order), in worker processes, or from split in this process if
+    jobs is 1. Returns the paths of the files that changed."""
+    if jobs == 1:
+        return [_render_layer(split, task) for task in tasks]
+    return _map(_render_worker_layer, tasks, jobs, _init_layer_worker,
+                (graph, layers))
+
+
+def _set_annotations(standoffheader, graph, header_file, split, files):
+    """Lists the files of the layers in the header, keeping the other
+    attributes of the files already listed"""
+    dirname = os.path.dirname(os.path.abspath(header_file))
+    datadesc = standoffheader.datadesc
+    if not datadesc.primaryData and graph.primary_data is not None:
+        loc = os.path.relpath(graph.primary_data.filename, dirname)
+        datadesc.primaryData = {'loc': loc.replace(os.sep, '/'),
+                                'f.id': 'text', 'loctype': 'relative'}
+    listed = dict((ann['f.id'], ann)
+                  for ann in datadesc.annotations_list or ())
+    datadesc.annotations_list = []
+    for layer, outputfile in zip(split, files):
+        ann = dict(listed.get(layer.name, {'loctype': 'relative'}))
+        ann['f.id'] = layer.name
+        ann['loc'] = os.path.relpath(os.path.abspath(outputfile),
+                                     dirname).replace(os.sep, '/')
+        datadesc.annotations_list.append(ann)
+
+
+def render_layers(graph, header_file, jobs=None, layers=None,
+                  order=GrafRenderer.SORTED, standoffheader=None):
+    """Splits a graph into layers with L{split_layers} and renders each
+    layer to its own file in parallel worker processes, next to a document
+    header listing them.
+
+    The graph is sent once to each worker: it is inherited by forked
+    workers and pickled to spawned ones.
+
+    Parameters
+    ----------
+    graph : Graph
+        The graph to render.
+    header_file : str
+        Path of the document header to write. The layers are written to
+        the same directory, see L{layer_filename}.
+    jobs : int, optional
+        Number of worker processes; the number of CPUs by default. The
+        layers are rendered in this process if 1.
+    layers : dict, optional
+        Maps annotation space ids to layer names, see L{split_layers}.
+    order : str
+        Order of the elements in the files, see L{GrafRenderer}.
+    standoffheader : StandoffHeader, optional
+        Header to write, e.g. read with L{StandoffHeaderParser}. Its list
+        of annotations is replaced by the layers.
+
+    Returns
+    -------
+    res : list of str
+        The paths of the layer files, in the order of the layers.
+
+    """
+    split = split_layers(graph, layers)
+    files = [layer_filename(header_file, layer.name) for layer in split]
+    tasks = [(i, outputfile, order) for i, outputfile in enumerate(files)]
+    _render_split(graph, layers, split, tasks, jobs)
+
+    if standoffheader is None:
+        standoffheader = StandoffHeader()
+    _set_annotations(standoffheader, graph, header_file, split, files)
+    StandoffHeaderRenderer(header_file).render(standoffheader)
+
+    return files
+
+
+class LayeredRenderer(object):
+    """
+    Renders a graph as a GrAF document that can be read back by an
+    instance of L{GraphParser}: a document header, and an annotation file
+    per layer with the annotation spaces, nodes, edges and regions of the
+    layer and its dependencies (see L{split_layers}).
+
+    When the document header exists, e.g. for a document that was parsed,
+    its descriptions and the files of its layers are kept, and each file
+    is only replaced if its content changed. As a parsed graph knows the
+    layer of each annotation space, it is written back to the files it was
+    read from.
+    """
+
+    def __init__(self, outputfile, jobs=1, layers=None,
+                 order=GrafRenderer.SORTED):
+        """Create an instance of a LayeredRenderer.
+
+        :param outputfile: path of the document header
+        :param jobs: number of worker processes rendering the layers, all
+            the CPUs if None
+        :param layers: C{dict} mapping annotation space ids to layer names,
+            see L{split_layers}
+        :param order: order of the elements in the files, see
+            L{GrafRenderer}
+
+        """
+        self.outputfile = outputfile
+        self.jobs = jobs
+        self.layers = layers
+        self.order = order
+
+    def render(self, g, changed=None):
+        """Renders the graph.
+
+        Parameters
+        ----------
+        g : Graph
+            The graph to render.
+        changed : iterable of str, optional
+            Names or annotation space ids of the layers that changed. The
+            other layers are only rendered if their file does not exist.
+            All the layers are rendered by default.
+
+        Returns
+        -------
+        res : list of str
+            The paths of the files that were written.
+
+        """
+        header_file = self.outputfile
+        dirname = os.path.dirname(header_file)
+        if os.path.exists(header_file):
+            standoffheader = StandoffHeaderParser().parse(header_file)
+        else:
+            standoffheader = StandoffHeader()
+        listed = dict((ann['f.id'], ann) for ann in
+                      standoffheader.datadesc.annotations_list or ())
+
+        split = split_layers(g, self.layers)
+        files = []
+        for layer in split:
+            ann = listed.get(layer.name)
+            if ann is not None and ann.get('loctype', 'relative') == 'relative':
+                files.append(os.path.join(dirname, ann['loc']))
+            else:
+                files.append(layer_filename(header_file, layer.name))
+
+        if changed is not None:
+            changed = set(changed)
+        tasks = [(i, outputfile, self.order)
+                 for i, (layer, outputfile) in enumerate(zip(split, files))
+                 if changed is None or not os.path.exists(outputfile) or
+                 layer.name in changed or layer._as_ids & changed]
+        written = []
+        if tasks:
+            written = [outputfile for outputfile in
+                       _render_split(g, self.layers, split, tasks, self.jobs)
+                       if outputfile is not None]
+
+        _set_annotations(standoffheader, g, header_file, split, files)
+
+        def render(path):
+            StandoffHeaderRenderer(path).render(standoffheader)
+
+        if _write_if_changed(render, header_file):
+            written.append(header_file)
+        return written
@@ -0,0 +1,435 @@
+# graf-python: Python GrAF API
+#
+# Copyright (C) 2014 American National Corpus
+# Author: Keith Suderman <suderman@cs.vassar.edu> (Original API)
+#         Stephen Matysik <smatysik@gmail.com> (Conversion to Python)
+# URL: <http://www.anc.org/>
+# For license information, see LICENSE.TXT
+#
+
+"""
+Validation of whole corpora: every document header and annotation file is
+checked against the GrAF schemas and for referential integrity (edges
+between missing nodes, links to missing regions, annotations of unknown
+elements, missing dependencies and files), in parallel worker processes.
+All errors are collected instead of stopping at the first one.
+
+Run as a script to print a report with one error per line::
+
+    python -m graf.validate [-j JOBS] [--format jsonl|csv] PATH...
+"""
+
+import csv
+import json
+import multiprocessing
+import os
+import sys
+from collections import namedtuple
+
+from xml.sax import make_parser, SAXParseException
+from xml.sax.handler import ContentHandler
+
+from graf.io import Constants, DocumentHeader, FileSource, \
+    GrAFXMLValidator, split_compression_ext
+
+# An error found in a file. error is the class of the error: the name of
+# the parser exception, or one of the integrity errors below.
+ValidationError = namedtuple('ValidationError',
+                             'file line column error message')
+
+MISSING_NODE = 'MissingNode'
+MISSING_REGION = 'MissingRegion'
+UNKNOWN_REFERENCE = 'UnknownReference'
+DUPLICATE_ID = 'DuplicateId'
+MISSING_DEPENDENCY = 'MissingDependency'
+MISSING_FILE = 'MissingFile'
+
+# What a worker reports about a file: the errors found in the file alone,
+# the ids it defines and the references it makes, to be resolved across
+# files once all of them are scanned
+_FileScan = namedtuple('_FileScan',
+                       'path errors nodes edges regions refs dependencies '
+                       'annotations')
+
+
+def _is_header(path):
+    return os.path.splitext(split_compression_ext(path)[0])[1] == '.hdr'
+
+
+class IntegrityScanner(ContentHandler):
+    """
+    Collects the ids defined and referenced in an annotation file or a
+    document header, with the line of each reference.
+    """
+
+    def __init__(self, path, constants=Constants):
+        ContentHandler.__init__(self)
+        self._path = path
+        self._g = constants
+        self._locator = None
+        self.errors = []
+        self.nodes = set()
+        self.edges = set()
+        self.regions = set()
+        # (error class, id, line, column) of each reference
+        self.refs = []
+        self.dependencies = []
+        # (f.id, loc) of the annotation files listed in a document header
+        self.annotations = []
+
+    def setDocumentLocator(self, locator):
+        self._locator = locator
+
+    def _position(self):
+        if self._locator is None:
+            return None, None
+        return self._locator.getLineNumber(), self._locator.getColumnNumber()
+
+    def _define(self, ids, attrs):
+        id = attrs.get(self._g.ID)
+        if id is None:
+            return
+        if id in self.nodes or id in self.edges or id in self.regions:
+            line, column = self._position()
+            self.errors.append(ValidationError(
+                self._path, line, column, DUPLICATE_ID,
+                'Duplicate id %r' % id))
+        ids.add(id)
+
+    def _refer(self, error, ids):
+        line, column = self._position()
+        for id in ids:
+            self.refs.append((error, id, line, column))
+
+    def startElement(self, name, attrs):
+        g = self._g
+        if name == g.NODE:
+            self._define(self.nodes, attrs)
+        elif name == g.EDGE:
+            self._define(self.edges, attrs)
+            self._refer(MISSING_NODE, [attrs.get(g.FROM), attrs.get(g.TO)])
+        elif name == g.REGION:
+            self._define(self.regions, attrs)
+        elif name == g.LINK:
+            self._refer(MISSING_REGION, attrs.get(g.TARGETS, '').split())
+        elif name == g.ANNOTATION:
+            self._refer(UNKNOWN_REFERENCE, [attrs.get(g.REF)])
+        elif name == g.DEPENDS_ON:
+            line, column = self._position()
+            self.dependencies.append((attrs.get(g.TYPE_F_ID) or
+                                      attrs.get(g.TYPE), line, column))
+        elif name in (g.PRIMARY_DATA, 'annotation') and g.LOC in attrs:
+            # Files listed in a document header
+            self._refer(MISSING_FILE, [attrs[g.LOC]])
+            if name == 'annotation':
+                self.annotations.append((attrs.get(g.TYPE_F_ID),
+                                         attrs[g.LOC]))
+
+
+class _ValidatingStream(object):
+    """
+    Feeds what is read from a stream to a schema validator, so that the
+    file is validated in the same pass as it is scanned. Schema errors are
+    reported once, and the scan goes on.
+    """
+
+    def __init__(self, stream, validator, report):
+        self._stream = stream
+        self._validator = validator
+        self._report = report
+
+    def _check(self, feed, *args):
+        try:
+            feed(*args)
+        except Exception as exc:
+            self._report(exc)
+            self._validator = None
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        if self._validator is not None:
+            if data:
+                self._check(self._validator.feed, data)
+            elif size != 0:
+                # xml.sax reads 0 bytes first to check for a binary stream
+                self._check(self._validator.close)
+                self._validator = None
+        return data
+
+    def close(self):
+        self._stream.close()
+
+
+def _exception_position(exc):
+    if isinstance(exc, SAXParseException):
+        return exc.getLineNumber(), exc.getColumnNumber()
+    position = getattr(exc, 'position', None)
+    if position:
+        return position
+    return getattr(exc, 'lineno', None), None
+
+
+def scan_file(path, schema=True, constants=Constants):
+    """Checks a single file against its schema and collects the ids it
+    defines and references. The references are resolved by
+    L{validate_corpus}, as they may point into dependencies.
+
+    Parameters
+    ----------
+    path : str
+        Path of a document header or annotation file.
+    schema : bool
+        Whether to validate the file against the GrAF schemas.
+
+    Returns
+    -------
+    res : _FileScan
+
+    """
+    scanner = IntegrityScanner(path, constants)
+    errors = scanner.errors
+    parser = make_parser()
+    parser.setContentHandler(scanner)
+
+    def report(exc):
+        line, column = _exception_position(exc)
+        errors.append(ValidationError(path, line, column,
+                                      type(exc).__name__, str(exc)))
+
+    validator = None
+    if schema:
+        try:
+            validator = GrAFXMLValidator().stream_validator(
+                header=_is_header(path))
+        except Exception as exc:
+            report(exc)
+
+    try:
+        # The parser closes the stream
+        parser.parse(_ValidatingStream(FileSource().open(path), validator,
+                                       report))
+    except (SAXParseException, IOError, OSError) as exc:
+        report(exc)
+
+    return _FileScan(path, errors, scanner.nodes, scanner.edges,
+                     scanner.regions, scanner.refs, scanner.dependencies,
+                     scanner.annotations)
+
+
+def _scan_file(args):
+    return scan_file(*args)
+
+
+def iter_corpus_files(paths):
+    """Generates the document headers and annotation files in the given
+    files and directories, recursively."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                ext = os.path.splitext(split_compression_ext(filename)[0])[1]
+                if ext in ('.hdr', '.xml'):
+                    yield os.path.join(dirpath, filename)
+
+
+def _key(path):
+    """The key of a file in the scans, the same whether it is compressed
+    or not"""
+    return os.path.normpath(split_compression_ext(path)[0])
+
+
+def _locators(scans):
+    """Maps the key of each annotation file listed in a scanned document
+    header to the keys of the files of that header, by f.id."""
+    res = {}
+    for scan in scans.values():
+        if not _is_header(scan.path):
+            continue
+        dirname = os.path.dirname(scan.path)
+        locations = dict((fid, _key(os.path.join(dirname, loc)))
+                         for fid, loc in scan.annotations)
+        for path in locations.values():
+            res[path] = locations
+    return res
+
+
+def _dependency_key(path, name, locators):
+    """The key of the file of a dependency of an annotation file, as
+    located by the document header listing the file, or None if the header
+    does not list it. Files without a header are located by convention."""
+    locations = locators.get(_key(path))
+    if locations is not None:
+        return locations.get(name)
+    return _key(DocumentHeader(path).get_location(name))
+
+
+def _resolve(scans, source):
+    """Returns the errors of the references of each file that are not
+    defined in the file or in the files it depends on."""
+    errors = []
+    locators = _locators(scans)
+    for scan in scans.values():
+        if _is_header(scan.path):
+            dirname = os.path.dirname(scan.path)
+            for error, loc, line, column in scan.refs:
+                if not source.exists(os.path.join(dirname, loc)):
+                    errors.append(ValidationError(
+                        scan.path, line, column, error,
+                        'File %r does not exist' % loc))
+            continue
+
+        # The files this one depends on, transitively
+        closure = [scan]
+        seen = set([_key(scan.path)])
+        i = 0
+        while i < len(closure):
+            current = closure[i]
+            i += 1
+            for name, line, column in current.dependencies:
+                path = _dependency_key(current.path, name, locators)
+                if path is None:
+                    if current is scan:
+                        errors.append(ValidationError(
+                            scan.path, line, column, MISSING_DEPENDENCY,
+                            'Dependency %r not listed in the document '
+                            'header' % (name,)))
+                    continue
+                if path in seen:
+                    continue
+                seen.add(path)
+                if path in scans:
+                    closure.append(scans[path])
+                elif current is scan:
+                    errors.append(ValidationError(
+                        scan.path, line, column, MISSING_DEPENDENCY,
+                        'Dependency %r not found at %r' % (name, path)))
+
+        for error, id, line, column in scan.refs:
+            if error == MISSING_REGION:
+                kinds = ('regions',)
+            elif error == MISSING_NODE:
+                kinds = ('nodes',)
+            else:
+                kinds = ('nodes', 'edges')
+            if not any(id in getattr(other, kind)
+                       for other in closure for kind in kinds):
+                errors.append(ValidationError(
+                    scan.path, line, column, error,
+                    'Unknown id %r' % (id,)))
+    return errors
+
+
+def validate_corpus(paths, jobs=None, schema=True, constants=Constants):
+    """Validates all the document headers and annotation files in the given
+    files and directories, and the dependencies of the annotation files.
+
+    Parameters
+    ----------
+    paths : iterable of str
+        Files and directories to validate.
+    jobs : int, optional
+        Number of worker processes; the number of CPUs by default. Files
+        are checked in this process if 1.
+    schema : bool
+        Whether to validate the files against the GrAF schemas, which
+        requires lxml. The schemas are compiled once in each worker.
+
+    Returns
+    -------
+    res : list of ValidationError
+        Sorted by file and line.
+
+    """
+    source = FileSource()
+    if schema:
+        # Fail early rather than once per file
+        validator = GrAFXMLValidator()
+        if not validator.import_validator:
+            raise ImportError('lxml is required to validate against the schemas')
+        try:
+            validator.header_xmlschema
+            validator.annotation_xmlschema
+        except Exception as exc:
+            raise ValueError('Cannot compile the GrAF schemas: %s' % exc)
+
+    pool = None
+    if jobs != 1:
+        pool = multiprocessing.Pool(jobs)
+    try:
+        scans = {}
+        pending = sorted(set(os.path.normpath(path)
+                             for path in iter_corpus_files(paths)))
+        while pending:
+            tasks = [(path, schema, constants) for path in pending]
+            if pool is None:
+                results = map(_scan_file, tasks)
+            else:
+                results = pool.imap_unordered(_scan_file, tasks, 16)
+            for scan in results:
+                scans[_key(scan.path)] = scan
+
+            # Dependencies outside of the given paths are checked too
+            pending = set()
+            locators = _locators(scans)
+            for scan in scans.values():
+                for name, line, column in scan.dependencies:
+                    path = _dependency_key(scan.path, name, locators)
+                    if (path is not None and path not in scans and
+                            source.exists(path)):
+                        pending.add(path)
+            pending = sorted(pending)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    errors = [error for scan in scans.values() for error in scan.errors]
+    errors.extend(_resolve(scans, source))
+    errors.sort(key=lambda error: (error.file, error.line or 0,
+                                   error.column or 0))
+    return errors
+
+
+def write_report(errors, output, format='jsonl'):
+    """Writes the errors to the given text stream, one per line, as JSON
+    objects or CSV rows with the fields of L{ValidationError}."""
+    if format == 'jsonl':
+        for error in errors:
+            output.write(json.dumps(error._asdict(), sort_keys=True) + '\n')
+    elif format == 'csv':
+        writer = csv.writer(output)
+        writer.writerow(ValidationError._fields)
+        writer.writerows(errors)
+    else:
+        raise ValueError('Unknown report format %r' % format)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Validate GrAF corpora against the GrAF schemas and '
+                    'for referential integrity.')
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help='files or directories to validate')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes')
+    parser.add_argument('--format', choices=('jsonl', 'csv'),
+                        default='jsonl', help='report format')
+    parser.add_argument('--no-schema', dest='schema', action='store_false',
+                        help='only check referential integrity')
+    args = parser.parse_args(argv)
+
+    try:
+        errors = validate_corpus(args.paths, args.jobs, args.schema)
+    except (ImportError, ValueError) as exc:
+        parser.error(str(exc))
+    write_report(errors, sys.stdout, args.format)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,7 +13,12 @@ This test serves to ensure the viability of the
 methods of the classes.
 """
 
-from graf import Graph, AnnotationSpace, Annotation, Node, Edge, Region
+import os
+import pickle
+import tempfile
+
+from graf import Graph, AnnotationSpace, Annotation, Node, Edge, Region, \
+    PrimaryData, FeatureStructure, FrozenFeatureStructure
 
 class TestGraph:
     """
@@ -103,6 +108,16 @@ class TestGraph:
         assert(self.graph.find_edge(fnode, tnode) ==edge)
         assert(self.graph.find_edge(fnode.id, tnode.id) ==edge)
 
+    def test_find_edges(self):
+        e1 = self.graph.create_edge(Node('node_1'), Node('node_2'))
+        e2 = self.graph.create_edge('node_1', 'node_2')
+        e3 = self.graph.create_edge('node_2', 'node_1')
+        assert(self.graph.find_edge('node_1', 'node_2') is e1)
+        assert(self.graph.find_edges('node_1', 'node_2') == [e1, e2])
+        assert(self.graph.find_edges('node_2', 'node_1') == [e3])
+        assert(self.graph.find_edge('node_1', 'node_3') is None)
+        assert(self.graph.find_edges('node_3', 'node_1') == [])
+
     def test_get_node(self):
         node = Node('test_node')
         self.graph.nodes.add(node)
@@ -163,6 +178,430 @@ class TestGraph:
         assert(list(n3.iter_parents()) == [n1])
         assert(list(n4.iter_parents()) == [n3])
 
+    def _build_annotated_graph(self):
+        xces = self.graph.annotation_spaces.create('xces')
+        other = self.graph.annotation_spaces.create('other')
+        n1 = self.graph.nodes.add(Node('n1'))
+        n2 = self.graph.nodes.add(Node('n2'))
+        n3 = self.graph.nodes.add(Node('n3'))
+        for node, label, aspace in ((n1, 's', xces), (n2, 'tok', xces),
+                                    (n3, 'tok', other)):
+            ann = node.annotations.create(label)
+            aspace.add(ann)
+        self.graph.create_edge(n1, n2, id='e1')
+        self.graph.create_edge(n1, n3, id='e2')
+        return n1, n2, n3
+
+    def test_view(self):
+        n1, n2, n3 = self._build_annotated_graph()
+
+        view = self.graph.view(aspaces=['xces'], labels=['tok', 's'])
+        assert(list(view.nodes) == [n1, n2])
+        assert(len(view.nodes) == 2)
+        assert('n1' in view.nodes)
+        assert(n3 not in view.nodes)
+        assert([e.id for e in view.edges] == ['e1'])
+        assert([a.label for a in view.annotations] == ['s', 'tok'])
+
+        view = view.view(labels=['tok'])
+        assert(list(view.nodes) == [n2])
+        assert(list(view.edges) == [])
+
+        # the graph itself is untouched
+        assert(len(self.graph.nodes) == 3)
+        assert(len(list(self.graph.view().annotations)) == 3)
+
+    def test_pickle(self):
+        n1, n2, n3 = self._build_annotated_graph()
+        region = Region('r1', 0, 5)
+        self.graph.regions.add(region)
+        n2.add_region(region)
+        n2.annotations.get_first('tok').features['pos'] = 'NN'
+        self.graph.root = n1
+
+        graph = pickle.loads(pickle.dumps(self.graph))
+
+        assert(sorted(graph.nodes.keys()) == ['n1', 'n2', 'n3'])
+        assert(graph.root.id == 'n1')
+        node = graph.nodes['n2']
+        assert(node.parent is graph.nodes['n1'])
+        assert(graph.find_edge('n1', 'n2').id == 'e1')
+        assert(node.links[0][0] is graph.regions['r1'])
+        assert(graph.regions['r1'].nodes == [node])
+        ann = node.annotations.get_first('tok')
+        assert(ann.element is node)
+        assert(ann.aspace is graph.annotation_spaces['xces'])
+        assert(ann.features['pos'] == 'NN')
+        assert(list(graph.annotation_spaces['xces'])[1] is ann)
+        assert(graph.header.annotation_spaces['other'] is
+               graph.annotation_spaces['other'])
+
+    def _build_tree(self):
+        # s -> np -> (w1, w2); s -> w3
+        nodes = [self.graph.nodes.add(Node(id))
+                 for id in ('s', 'np', 'w1', 'w2', 'w3')]
+        s, np, w1, w2, w3 = nodes
+        for node, anchors in ((w1, (0, 3)), (w2, (4, 9)), (w3, (10, 13))):
+            region = Region('r-' + node.id, *anchors)
+            self.graph.regions.add(region)
+            node.add_region(region)
+        self.graph.create_edge(s, np)
+        self.graph.create_edge(np, w1)
+        self.graph.create_edge(np, w2)
+        self.graph.create_edge(s, w3)
+        return nodes
+
+    def test_node_spans(self):
+        s, np, w1, w2, w3 = self._build_tree()
+        lone = self.graph.nodes.add(Node('lone'))
+
+        spans = self.graph.node_spans([s, w2, lone])
+        assert(spans == {'s': (0, 13), 'w2': (4, 9), 'lone': None})
+        assert(np.span == (0, 9))
+
+        fd, filename = tempfile.mkstemp(suffix='.txt')
+        os.write(fd, u'Th\u00e9 small c\u00e0t'.encode('utf-8'))
+        os.close(fd)
+        try:
+            self.graph.primary_data = PrimaryData(filename, cache=False)
+            assert(self.graph.texts([np, w3, lone]) ==
+                   [u'Th\u00e9 small', u'c\u00e0t', None])
+            self.graph.primary_data.close()
+        finally:
+            os.remove(filename)
+
+    def test_span_invalidation(self):
+        s, np, w1, w2, w3 = self._build_tree()
+        assert(s.span == (0, 13))
+
+        w4 = self.graph.nodes.add(Node('w4'))
+        w4.add_region(Region('r-w4', 14, 20))
+        self.graph.create_edge(np, w4)
+        assert(np.span == (0, 20))
+        assert(s.span == (0, 20))
+
+        w1.add_region(Region('r-w1b', 30, 32))
+        assert(s.span == (0, 32))
+        assert(w3.span == (10, 13))
+
+    def test_traversal(self):
+        s, np, w1, w2, w3 = self._build_tree()
+
+        assert([n.id for n in self.graph.iter_bfs()] ==
+               ['s', 'np', 'w3', 'w1', 'w2'])
+        assert([n.id for n in self.graph.iter_dfs(s)] ==
+               ['s', 'np', 'w1', 'w2', 'w3'])
+        assert([n.id for n in self.graph.iter_descendants('np')] ==
+               ['w1', 'w2'])
+        assert([n.id for n in self.graph.iter_ancestors(w2)] == ['np', 's'])
+
+        order = [n.id for n in self.graph.topological_sort()]
+        assert(order.index('s') < order.index('np') < order.index('w1'))
+
+        self.graph.create_edge(w1, s)
+        try:
+            self.graph.topological_sort()
+            assert(False)
+        except ValueError:
+            pass
+
+    def test_deep_traversal(self):
+        nodes = [self.graph.nodes.add(Node('n%d' % i)) for i in range(5000)]
+        for parent, child in zip(nodes, nodes[1:]):
+            self.graph.create_edge(parent, child)
+            child.visited = True
+
+        assert(len(list(self.graph.iter_dfs())) == 5000)
+        assert(self.graph.topological_sort()[-1] is nodes[-1])
+        nodes[0].clear()
+        assert(not nodes[-1].visited)
+
+    def test_remove(self):
+        s, np, w1, w2, w3 = self._build_tree()
+        aspace = self.graph.annotation_spaces.create('syn')
+        np_ann = np.annotations.create('NP')
+        aspace.add(np_ann)
+        edge = self.graph.find_edge(s, np)
+        edge_ann = edge.annotations.create('dep')
+        aspace.add(edge_ann)
+        self.graph.root = s
+        assert(s.span == (0, 13))
+
+        self.graph.remove_edge(edge)
+        assert('e0' not in self.graph.edges)
+        assert(list(s.iter_children()) == [w3])
+        assert(list(np.iter_parents()) == [])
+        assert(self.graph.find_edge(s, np) is None)
+        assert(list(aspace) == [np_ann])
+        assert(s.span == (10, 13))
+
+        self.graph.remove_node('w2')
+        assert('w2' not in self.graph.nodes)
+        assert(list(np.iter_children()) == [w1])
+        assert(self.graph.regions['r-w2'].nodes == [])
+        assert(np.span == (0, 3))
+
+        self.graph.remove_region('r-w1')
+        assert('r-w1' not in self.graph.regions)
+        assert(w1.links == [])
+        assert(np.span is None)
+
+        self.graph.remove_node(np)
+        assert(list(aspace) == [])
+        self.graph.remove_node(s)
+        assert(self.graph.root is None)
+
+    def test_remove_hub_edges(self):
+        hub = self.graph.nodes.add(Node('hub'))
+        leaves = [self.graph.nodes.add(Node('l%d' % i)) for i in range(100)]
+        for leaf in leaves:
+            self.graph.create_edge(hub, leaf)
+
+        # The edge lists of the hub are not scanned for each leaf
+        for leaf in leaves[::2]:
+            self.graph.remove_node(leaf)
+        assert(len(hub.out_edges) == 50)
+        assert(list(hub.iter_children()) == leaves[1::2])
+        assert(hub.out_edges[0].to_node is leaves[1])
+        assert(hub.out_edges[-1].to_node is leaves[99])
+        assert(len(hub.out_edges._by_ind) == 50)
+
+        self.graph.remove_where(nodes=lambda node: node.id in ('l1', 'l3'))
+        assert([e.to_node for e in hub.out_edges][:2] == [leaves[5], leaves[7]])
+        assert(len(self.graph.edges) == 48)
+
+    def test_remove_where(self):
+        s, np, w1, w2, w3 = self._build_tree()
+        aspace = self.graph.annotation_spaces.create('syn')
+        for node in (s, np, w1):
+            aspace.add(node.annotations.create(node.id))
+        self.graph.create_edge(np, w2)
+
+        removed = self.graph.remove_where(
+            nodes=lambda node: node.id == 'w2',
+            edges=lambda edge: edge.to_node.id == 'w3',
+            regions=lambda region: region.id == 'r-w1')
+        assert(removed == (1, 3, 1))
+        assert(sorted(self.graph.nodes.keys()) == ['np', 's', 'w1', 'w3'])
+        assert(list(np.out_edges) == [self.graph.find_edge(np, w1)])
+        assert(self.graph.find_edges(np, w2) == [])
+        assert(list(s.iter_children()) == [np])
+        assert(w1.links == [])
+        assert(self.graph.regions['r-w3'].nodes == [w3])
+        assert([ann.label for ann in aspace] == ['s', 'np', 'w1'])
+        assert(s.span is None)
+
+    def test_remove_annotations(self):
+        aspace = self.graph.annotation_spaces.create('pos')
+        nodes = [self.graph.nodes.add(Node('n%d' % i)) for i in range(100)]
+        for node in nodes:
+            ann = node.annotations.create('tok' if int(node.id[1:]) % 3 else 'punc')
+            aspace.add(ann)
+
+        ann = nodes[1].annotations.get_first()
+        aspace.remove(ann)
+        assert(ann not in aspace)
+        assert(len(nodes[1].annotations) == 0)
+        assert(ann.aspace is None and ann.element is None)
+
+        aspace.remove_where('punc')
+        assert(len(aspace) == 65)
+        assert(not nodes[0].is_annotated)
+        assert([a.element for a in aspace][:2] == [nodes[2], nodes[4]])
+
+        ann = nodes[2].annotations.get_first()
+        nodes[2].annotations.remove(ann)
+        assert(ann not in aspace)
+        assert(len(aspace) == 64)
+
+        # Adding an annotation to another list moves it there
+        s1 = self.graph.annotation_spaces.create('s1')
+        s2 = self.graph.annotation_spaces.create('s2')
+        ann = Annotation('tok')
+        s1.add(ann)
+        s2.add(ann)
+        assert(ann not in s1 and ann in s2 and ann.aspace is s2)
+        s1.remove(ann)
+        assert(ann in s2 and ann.aspace is s2)
+        s2.remove(ann)
+        assert(len(s1) == len(s2) == 0 and ann.aspace is None)
+
+        nodes[5].annotations.add(ann)
+        s2.add(ann)
+        nodes[6].annotations.add(ann)
+        assert(ann not in nodes[5].annotations)
+        assert(ann.element is nodes[6] and ann.aspace is s2)
+        nodes[5].annotations.remove_all([ann])
+        assert(ann in nodes[6].annotations and ann in s2)
+        nodes[6].annotations.remove(ann)
+        assert(ann not in s2 and ann.element is None and ann.aspace is None)
+
+        assert(Annotation('tok', id='a') == Annotation('punc', id='a'))
+        assert(Annotation('tok', id='a') != 'a')
+
+    def test_feature_path(self):
+        ann = Annotation('tok', {'pos': 'NN', 'morph/case': 'gen'})
+        assert(ann.features['pos'] == 'NN')
+        assert(ann.features['morph/case'] == 'gen')
+        assert(ann.features[('morph', 'case')] == 'gen')
+        assert('morph/case' in ann.features and 'pos' in ann.features)
+        assert('pos/case' not in ann.features)
+
+        case = FeatureStructure.path('/morph/case')
+        assert(case(ann.features) == 'gen')
+        assert(case.get(Annotation('tok').features, 'none') == 'none')
+        assert(FeatureStructure.path(['pos']).get(ann.features) == 'NN')
+        try:
+            FeatureStructure.path('pos/case')(ann.features)
+            assert(False)
+        except KeyError:
+            pass
+
+    def test_unify(self):
+        import copy
+
+        shared = FeatureStructure(items={'case': 'gen', 'num': 'sg'})
+        fs = FeatureStructure('tok', {'pos': 'NN'})
+        fs['agr'] = shared
+        other = FeatureStructure(None, {'lemma': 'cat', 'agr/num': 'sg'})
+        other['morph'] = FeatureStructure(items={'stem': 'cat'})
+
+        res = fs.unify(other)
+        assert(res.type == 'tok')
+        assert(res['pos'] == 'NN' and res['lemma'] == 'cat')
+        assert(res['agr/case'] == 'gen' and res['agr/num'] == 'sg')
+        assert(res['agr'] is not shared)
+        assert('lemma' not in fs and 'pos' not in other)
+
+        # Untouched structures are shared, and copied on the first write
+        assert(res['morph'] is other['morph'])
+        res['morph/stem'] = 'dog'
+        assert(res['morph/stem'] == 'dog' and other['morph/stem'] == 'cat')
+        assert(res['morph'] is not other['morph'])
+        res['morph/case/form'] = 'gen'
+        del res['agr/case']
+        assert('case' not in other['morph'] and shared['case'] == 'gen')
+
+        res = fs.unify(FeatureStructure(items={'lemma': 'cat'}))
+        assert(res['agr'] is shared)
+        res['agr/num'] = 'pl'
+        assert(res.pop('agr/case') == 'gen')
+        assert(shared['num'] == 'sg' and shared['case'] == 'gen')
+        assert(fs['agr'] is shared and len(fs) == 2)
+        assert(fs.unify(fs) is not fs)
+
+        # A structure set on the result is its own, and is written into
+        mine = FeatureStructure(items={'stem': 'cat'})
+        res['morph'] = mine
+        res['morph/stem'] = 'dog'
+        assert(res['morph'] is mine and mine['stem'] == 'dog')
+
+        frozen = FeatureStructure(items={'case': 'gen'}).freeze()
+        res = FeatureStructure(items={'agr': frozen}).unify(FeatureStructure())
+        assert(res['agr'] is frozen)
+        res['agr/case'] = 'nom'
+        assert(frozen['case'] == 'gen' and res['agr/case'] == 'nom')
+
+        try:
+            fs.unify(FeatureStructure(items={'agr/case': 'nom'}))
+            assert(False)
+        except ValueError:
+            pass
+
+        pairs = [(fs, other), (fs, FeatureStructure(items={'pos': 'VB'})),
+                 (fs, other)]
+        results = FeatureStructure.unify_all(pairs, strict=False)
+        assert(results[1] is None)
+        assert(results[0] is not results[2])
+        assert(results[0]['agr'] is results[2]['agr'])
+        results[0]['agr/num'] = 'pl'
+        assert(results[2]['agr/num'] == 'sg')
+
+        res = fs.unify(FeatureStructure(items={'lemma': 'cat'}))
+        deep = copy.deepcopy(res)
+        assert(deep['agr'] is not shared and deep['agr/case'] == 'gen')
+
+    def test_frozen_features(self):
+        pool = {}
+        fs = FeatureStructure('tok', {'pos': 'NN', 'agr/num': 'sg'})
+        frozen = fs.freeze(pool)
+        assert(isinstance(frozen['agr'], FrozenFeatureStructure))
+        assert(frozen.freeze(pool) is frozen)
+        assert(fs.thaw().freeze(pool) is frozen)
+        assert(FrozenFeatureStructure('tok', {'agr/num': 'sg', 'pos': 'NN'}) == frozen)
+        assert(hash(FrozenFeatureStructure('tok', {'agr/num': 'sg', 'pos': 'NN'})) == hash(frozen))
+        assert(frozen != FrozenFeatureStructure('tok', {'pos': 'NN'}))
+        assert(frozen.subsumes(frozen))
+
+        # Plain and frozen structures are compared by content, both ways
+        assert(frozen == fs and fs == frozen)
+        assert(not frozen != fs and not fs != frozen)
+        changed = fs.thaw()
+        changed['agr/num'] = 'pl'
+        assert(frozen != changed and changed != frozen)
+        assert(not frozen == changed and not changed == frozen)
+        assert(frozen != 'tok' and 'tok' != frozen)
+        record = ('tok', (('pos', 'NN'), ('agr', (None, (('num', 'sg'),)))))
+        assert(FrozenFeatureStructure.from_record(record) is not frozen)
+        assert(FrozenFeatureStructure.from_record(record) == frozen)
+        assert(isinstance(FrozenFeatureStructure.from_record(record)['agr'],
+                          FrozenFeatureStructure))
+        assert(pickle.loads(pickle.dumps(frozen)) == frozen)
+
+        for set_feature in (lambda: frozen.__setitem__('pos', 'VB'),
+                            lambda: setattr(frozen, 'type', 'word'),
+                            lambda: frozen['agr'].update({'num': 'pl'})):
+            try:
+                set_feature()
+                assert(False)
+            except TypeError:
+                pass
+
+        thawed = frozen.thaw()
+        thawed['agr/num'] = 'pl'
+        assert(frozen['agr/num'] == 'sg')
+
+        # Nested frozen structures are copied, not modified through paths
+        fs = FeatureStructure('tok', {'pos': 'NN'})
+        fs['agr'] = frozen['agr']
+        fs['agr/num'] = 'pl'
+        fs['agr/case/form'] = 'gen'
+        assert(fs['agr/num'] == 'pl' and fs['agr/case/form'] == 'gen')
+        assert(not isinstance(fs['agr'], FrozenFeatureStructure))
+        assert(frozen['agr/num'] == 'sg' and 'agr/case' not in frozen)
+        assert(pool[frozen['agr']] is frozen['agr'])
+        fs['agr'] = frozen['agr']
+        assert(fs.setdefault('agr/num', 'pl') == 'sg')
+        assert(fs['agr'] is frozen['agr'])
+        assert(fs.pop('agr/num') == 'sg')
+        assert(fs.pop('agr/num', 'none') == 'none')
+        fs['agr'] = frozen['agr']
+        del fs['agr/num']
+        assert('agr/num' not in fs and frozen['agr/num'] == 'sg')
+
+    def test_primary_data(self):
+        text = u'b\u0101di\u0161\u0101 \u014dd\u0101 s\u012b=(y)a b\u016bt\n' * 50
+        fd, filename = tempfile.mkstemp(suffix='.txt')
+        os.write(fd, text.encode('utf-8'))
+        os.close(fd)
+        try:
+            for i in range(2):
+                # the second time the cached index is used
+                primary_data = PrimaryData(filename, sample=16)
+                assert(len(primary_data) == len(text))
+                assert(primary_data.region_text(Region('r1', 7, 11)) ==
+                       text[7:11])
+                assert(primary_data[500:530] == text[500:530])
+                offset = primary_data.char_to_byte(100)
+                assert(offset == len(text[:100].encode('utf-8')))
+                assert(primary_data.byte_to_char(offset) == 100)
+                primary_data.close()
+            assert(os.path.exists(filename + PrimaryData.INDEX_EXT))
+        finally:
+            os.remove(filename)
+            if os.path.exists(filename + PrimaryData.INDEX_EXT):
+                os.remove(filename + PrimaryData.INDEX_EXT)
+
     # TODO: Test makes wrong assumption. The problem is not that
     # Annotations might get added twice, but that one file might
     # be parsed twice.
@@ -59,3 +59,471 @@ class TestGraphParser:
         parsed_dependencies = self.gparser._parsed_deps
 
         assert(parsed_dependencies == expected_parsed_deps)
+
+        # Layers listed in the header are parsed once, even when other
+        # layers depend on them
+        sizes = dict((aspace.as_id, len(aspace))
+                     for aspace in g.annotation_spaces)
+        assert(sizes == {'utterance': 111, 'clause_unit': 111, 'word': 396,
+                         'wfw': 396, 'graid1': 33, 'graid2': 3,
+                         'translation': 111, 'comment': 0})
+
+    def test_parse_async(self):
+        import asyncio
+        import io
+        import threading
+
+        filename = os.path.dirname(__file__) + '/sample_files/balochi.hdr'
+        g = asyncio.run(self.gparser.parse_async(filename))
+
+        assert(len(g.nodes) == 1161)
+        assert(self.gparser._parsed_deps ==
+               set(['word', 'clause_unit', 'utterance']))
+        # Layers listed in the header are parsed once, even when other
+        # layers depend on them
+        sizes = dict((aspace.as_id, len(aspace))
+                     for aspace in g.annotation_spaces)
+        assert(sizes['utterance'] == 111)
+        assert(sizes['word'] == 396)
+
+        # A dependency declared after the first node is not prefetched,
+        # and is read in the executor rather than on the event loop
+        threads = []
+        files = {
+            'seg': b'<graph xmlns="http://www.xces.org/ns/GrAF/1.0/">'
+                   b'<node xml:id="s1"/></graph>',
+            'tok': b'<graph xmlns="http://www.xces.org/ns/GrAF/1.0/">'
+                   b'<node xml:id="t1"/><graphHeader><dependencies>'
+                   b'<dependsOn f.id="seg"/></dependencies></graphHeader>'
+                   b'<edge xml:id="e1" from="t1" to="s1"/></graph>'}
+
+        def get_dependency(name):
+            threads.append(threading.current_thread())
+            return io.BytesIO(files[name])
+
+        gparser = GraphParser(get_dependency=get_dependency)
+        stream = io.BytesIO(files['tok'])
+        stream.name = 'tok.xml'
+        g = asyncio.run(gparser.parse_async(stream))
+        assert(len(g.nodes) == 2 and len(g.edges) == 1)
+        assert(threads and threading.main_thread() not in threads)
+
+    def test_feed(self):
+        dirname = os.path.dirname(__file__) + '/sample_files/'
+
+        def get_dependency(name):
+            return open(dirname + 'balochi-' + name + '.xml', 'rb')
+
+        gparser = GraphParser(get_dependency)
+        with open(dirname + 'balochi-graid1.xml', 'rb') as stream:
+            chunk = stream.read(1000)
+            while chunk:
+                gparser.feed(chunk)
+                chunk = stream.read(1000)
+        g = gparser.close()
+
+        assert(len(g.nodes) == 651)
+        assert(gparser._parsed_deps ==
+               set(['word', 'clause_unit', 'utterance']))
+
+    def test_feed_small_chunks(self):
+        dirname = os.path.dirname(__file__) + '/sample_files/'
+
+        def get_dependency(name):
+            return open(dirname + 'balochi-' + name + '.xml', 'rb')
+
+        def features(g):
+            return sorted((a.id, sorted(a.features.items()))
+                          for aspace in g.annotation_spaces for a in aspace)
+
+        expected = features(self.gparser.parse(dirname + 'balochi-wfw.xml'))
+
+        # Feature values are split across chunks
+        gparser = GraphParser(get_dependency)
+        with open(dirname + 'balochi-wfw.xml', 'rb') as stream:
+            chunk = stream.read(7)
+            while chunk:
+                gparser.feed(chunk)
+                chunk = stream.read(7)
+        g = gparser.close()
+
+        assert(features(g) == expected)
+
+    def test_feed_errors(self):
+        dirname = os.path.dirname(__file__) + '/sample_files/'
+        gparser = GraphParser()
+
+        # Dependencies cannot be resolved without get_dependency
+        with open(dirname + 'balochi-word.xml', 'rb') as stream:
+            try:
+                gparser.feed(stream.read())
+            except ValueError:
+                pass
+            else:
+                raise AssertionError('The dependency was ignored')
+
+        # The broken document is discarded
+        with open(dirname + 'balochi-utterance.xml', 'rb') as stream:
+            gparser.feed(stream.read())
+        g = gparser.close()
+
+        assert(len(g.nodes) == 111)
+
+    def test_parse_compressed(self):
+        import gzip
+        import shutil
+        import tempfile
+
+        dirname = os.path.dirname(__file__) + '/sample_files/'
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for name in ('graid1', 'word', 'clause_unit', 'utterance'):
+                filename = 'balochi-' + name + '.xml'
+                with open(dirname + filename, 'rb') as src:
+                    with gzip.open(os.path.join(tmpdir, filename + '.gz'),
+                                   'wb') as dst:
+                        shutil.copyfileobj(src, dst)
+
+            g = self.gparser.parse(os.path.join(tmpdir,
+                                                'balochi-graid1.xml.gz'))
+            assert(len(g.nodes) == 651)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_parse_zip(self):
+        import io
+        import zipfile
+
+        from graf import ZipSource
+
+        dirname = os.path.dirname(__file__) + '/sample_files/'
+        data = io.BytesIO()
+        archive = zipfile.ZipFile(data, 'w')
+        for filename in os.listdir(dirname):
+            if filename.startswith('balochi'):
+                archive.write(dirname + filename, 'corpus/' + filename)
+        archive.close()
+        data.seek(0)
+
+        with ZipSource(data) as source:
+            gparser = GraphParser(source=source)
+            g = gparser.parse('corpus/balochi.hdr')
+
+        assert(len(g.nodes) == 1161)
+        assert(gparser._parsed_deps ==
+               set(['word', 'clause_unit', 'utterance']))
+
+    def test_parse_tar(self):
+        import asyncio
+        import io
+        import tarfile
+
+        from graf import TarSource
+
+        dirname = os.path.dirname(__file__) + '/sample_files/'
+        data = io.BytesIO()
+        archive = tarfile.open(fileobj=data, mode='w:gz')
+        for filename in os.listdir(dirname):
+            if filename.startswith('balochi'):
+                archive.add(dirname + filename, 'corpus/' + filename)
+        archive.close()
+
+        data.seek(0)
+        with TarSource(data) as source:
+            gparser = GraphParser(source=source)
+            g = gparser.parse('corpus/balochi.hdr')
+        assert(len(g.nodes) == 1161)
+        assert(gparser._parsed_deps ==
+               set(['word', 'clause_unit', 'utterance']))
+
+        # The dependencies of a single annotation file are found next to it
+        data.seek(0)
+        with TarSource(data) as source:
+            gparser = GraphParser(source=source)
+            g = asyncio.run(gparser.parse_async('corpus/balochi-wfw.xml'))
+        assert(gparser._parsed_deps ==
+               set(['word', 'clause_unit', 'utterance']))
+        assert(len(g.nodes) ==
+               len(GraphParser().parse(dirname + 'balochi-wfw.xml').nodes))
+
+        data.seek(0)
+        with TarSource(data) as source:
+            gparser = GraphParser(source=source)
+            g = asyncio.run(gparser.parse_async('corpus/balochi.hdr'))
+        assert(len(g.nodes) == 1161)
+
+        # Several documents read concurrently from the same archive
+        async def parse_all(source):
+            return await asyncio.gather(*[
+                GraphParser(source=source).parse_async('corpus/balochi.hdr')
+                for i in range(8)])
+
+        data.seek(0)
+        with TarSource(data) as source:
+            graphs = asyncio.run(parse_all(source))
+        assert([len(g.nodes) for g in graphs] == [1161] * 8)
+
+    def test_pickle_zip(self):
+        import io
+        import pickle
+        import shutil
+        import tempfile
+        import zipfile
+
+        from graf import ZipSource
+
+        dirname = os.path.dirname(__file__) + '/sample_files/'
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'corpus.zip')
+            archive = zipfile.ZipFile(filename, 'w')
+            for name in os.listdir(dirname):
+                if name.startswith('balochi'):
+                    archive.write(dirname + name, 'corpus/' + name)
+            # The primary data file named in balochi.hdr
+            archive.writestr('corpus/balochi.pickle',
+                             u'D\u00eahk\u00e2n'.encode('utf-8'))
+            archive.close()
+
+            with ZipSource(filename) as source:
+                g = GraphParser(source=source).parse('corpus/balochi.hdr')
+                assert(g.primary_data.text(0, 6) == u'D\u00eahk\u00e2n')
+                data = pickle.dumps(g)
+
+            g = pickle.loads(data)
+            assert(len(g.nodes) == 1161)
+            assert(g.primary_data.text(1, 4) == u'\u00eahk')
+            g.primary_data.source.close()
+            assert(os.listdir(tmpdir) == ['corpus.zip'])
+
+            # Archives opened from a file object cannot be opened again
+            with open(filename, 'rb') as stream:
+                with ZipSource(io.BytesIO(stream.read())) as source:
+                    try:
+                        pickle.dumps(source)
+                    except TypeError:
+                        pass
+                    else:
+                        raise AssertionError('The archive was pickled')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_parse_lazy_features(self):
+        from graf import FeatureStructure
+
+        def to_dict(fs):
+            return fs.type, dict((name, to_dict(value) if isinstance(value, FeatureStructure) else value)
+                                 for name, value in fs.items())
+
+        filename = os.path.dirname(__file__) + '/sample_files/balochi.hdr'
+        eager = self.gparser.parse(filename)
+        lazy = GraphParser(lazy_features=True).parse(filename)
+
+        eager_anns = [ann for node in eager.nodes for ann in node.annotations]
+        lazy_anns = [lazy.nodes[ann.element.id].annotations.get_first(ann.label)
+                     for ann in eager_anns]
+        assert(all(ann._raw_features is not None for ann in lazy_anns))
+        assert([ann.label for ann in lazy_anns] == [ann.label for ann in eager_anns])
+        assert([to_dict(ann.features) for ann in lazy_anns] ==
+               [to_dict(ann.features) for ann in eager_anns])
+        assert(all(ann._raw_features is None for ann in lazy_anns))
+
+        fs = FeatureStructure.from_record(('t', (('a', 'x'), ('b', (None, (('c', 'y'),))))))
+        assert(to_dict(fs) == ('t', {'a': 'x', 'b': (None, {'c': 'y'})}))
+
+    def test_parse_nested_features(self):
+        data = (b'<graph xmlns="http://www.xces.org/ns/GrAF/1.0/">\n'
+                b'  <graphHeader><annotationSpaces>\n'
+                b'    <annotationSpace as.id="PTB"/>\n'
+                b'  </annotationSpaces></graphHeader>\n'
+                b'  <node xml:id="n0"/>\n'
+                b'  <a label="NP" ref="n0" as="PTB" xml:id="a0">\n'
+                b'    <fs>\n'
+                b'      <f name="head">\n'
+                b'        <fs type="word"><f name="base">hello</f></fs>\n'
+                b'      </f>\n'
+                b'      <f name="cat">noun &amp; phrase</f>\n'
+                b'    </fs>\n'
+                b'  </a>\n'
+                b'</graph>\n')
+
+        for lazy in (False, True):
+            # Chunks small enough to split the feature values
+            gparser = GraphParser(lazy_features=lazy)
+            for i in range(0, len(data), 5):
+                gparser.feed(data[i:i + 5])
+            g = gparser.close()
+
+            features = g.nodes['n0'].annotations.get_first('NP').features
+            assert(features['head'].type == 'word')
+            assert(features['head/base'] == 'hello')
+            assert(features['cat'] == 'noun & phrase')
+
+    def test_parse_intern_features(self):
+        from graf import FrozenFeatureStructure
+
+        filename = os.path.dirname(__file__) + '/sample_files/balochi-word.xml'
+        g = GraphParser(intern_features=True).parse(filename)
+
+        features = [ann.features for node in g.nodes for ann in node.annotations]
+        assert(all(isinstance(fs, FrozenFeatureStructure) for fs in features))
+        unique = dict((id(fs), fs) for fs in features)
+        assert(len(unique) == len(set(features)) < len(features))
+
+        pool = {}
+        g = GraphParser(lazy_features=True, intern_features=pool).parse(filename)
+        records = [ann._raw_features for node in g.nodes for ann in node.annotations]
+        assert(len(set(map(id, records))) == len(pool) < len(records))
+
+        g = GraphParser(intern_features=None).parse(filename)
+        assert(not any(isinstance(ann.features, FrozenFeatureStructure)
+                       for node in g.nodes for ann in node.annotations))
+        try:
+            GraphParser(intern_features=[])
+        except TypeError:
+            pass
+        else:
+            raise AssertionError('A list was accepted as the pool')
+
+    def test_parse_validate(self):
+        import shutil
+        import tempfile
+
+        try:
+            from lxml import etree
+        except ImportError:
+            return
+
+        from graf.io import GrAFXMLValidator
+
+        schema = (b'<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" '
+                  b'targetNamespace="http://www.xces.org/ns/GrAF/1.0/" '
+                  b'elementFormDefault="qualified">'
+                  b'<xs:element name="graph"><xs:complexType><xs:sequence>'
+                  b'<xs:any processContents="skip" maxOccurs="%s"/>'
+                  b'</xs:sequence></xs:complexType></xs:element></xs:schema>')
+        filename = os.path.dirname(__file__) + '/sample_files/balochi-word.xml'
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for max_occurs in (b'unbounded', b'1'):
+                xsd = os.path.join(tmpdir, max_occurs.decode('ascii') + '.xsd')
+                with open(xsd, 'wb') as f:
+                    f.write(schema % max_occurs)
+
+                gparser = GraphParser(validate=True)
+                gparser.graf_validator = GrAFXMLValidator(annotation_xsd=xsd)
+                assert(gparser.graf_validator.annotation_xmlschema is
+                       GrAFXMLValidator(annotation_xsd=xsd).annotation_xmlschema)
+                try:
+                    g = gparser.parse(filename)
+                except etree.XMLSyntaxError:
+                    assert(max_occurs == b'1')
+                else:
+                    assert(max_occurs == b'unbounded')
+                    assert(len(g.nodes) == len(GraphParser().parse(filename).nodes))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_parse_validate_schemas(self):
+        import shutil
+        import tempfile
+
+        try:
+            from lxml import etree
+        except ImportError:
+            return
+
+        # The GrAF schemas and the schemas they import are read locally
+        dirname = os.path.dirname(__file__) + '/sample_files/'
+        g = GraphParser(validate=True).parse(dirname + 'balochi.hdr')
+        assert(len(g.nodes) == 1161)
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'broken.xml')
+            with open(filename, 'w') as f:
+                f.write('<graph xmlns="http://www.xces.org/ns/GrAF/1.0/">'
+                        '<node xml:id="n1"/></graph>')
+            GraphParser().parse(filename)
+            try:
+                GraphParser(validate=True).parse(filename)
+            except etree.XMLSyntaxError:
+                pass
+            else:
+                raise AssertionError('The graph without header was accepted')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_parse_validate_without_lxml(self):
+        import sys
+
+        # Importing a module set to None in sys.modules fails
+        modules = dict((name, sys.modules.get(name))
+                       for name in ('lxml', 'lxml.etree'))
+        sys.modules.update(dict.fromkeys(modules))
+        try:
+            try:
+                GraphParser(validate=True)
+            except ImportError:
+                pass
+            else:
+                raise AssertionError('The files would not be validated')
+            GraphParser()
+        finally:
+            for name, module in modules.items():
+                if module is None:
+                    del sys.modules[name]
+                else:
+                    sys.modules[name] = module
+
+    def test_document_header(self):
+        import shutil
+        import tempfile
+
+        from graf.io import DocumentHeader
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'balochi.hdr')
+            shutil.copy(os.path.dirname(__file__) + '/sample_files/balochi.hdr', filename)
+            header = DocumentHeader.from_file(filename)
+            assert(header.attributes['docId'] == 'PoioAPI-26289')
+            assert(header.filedesc.titlestmt == 'Pickle Example')
+            assert(header.primary_data_loc == 'balochi.pickle')
+            assert(header.annotations[:2] == [('utterance', 'balochi-utterance.xml'),
+                                              ('clause_unit', 'balochi-clause_unit.xml')])
+            assert(len(header.datadesc.annotations_list) == 8)
+            assert(header.get_location('word') == 'balochi-word.xml')
+            assert(DocumentHeader.from_file(filename) is header)
+
+            with open(filename, 'a') as f:
+                f.write('\n')
+            assert(DocumentHeader.from_file(filename) is not header)
+        finally:
+            shutil.rmtree(tmpdir)
+
+        header = DocumentHeader('doc.hdr').load(
+            '<documentHeader version="1.0.0"><fileDesc>'
+            '<titleStmt><title>Doc</title></titleStmt>'
+            '<extent unit="word" count="2"/>'
+            '<sourceDesc><title>Source</title><author sex="f">Ann</author>'
+            '<pubDate iso8601="2014-01-01"/><idno type="ISBN">123</idno></sourceDesc>'
+            '</fileDesc><profileDesc><langUsage><language iso639="bal"/></langUsage>'
+            '<textClass catRef="fiction"><domain>narrative</domain></textClass>'
+            '<particDesc><person id="p1" age="30"/></particDesc>'
+            '<settingDesc><setting who="p1"><time>noon</time><locale>home</locale>'
+            '</setting></settingDesc></profileDesc></documentHeader>')
+        assert(header.attributes == {'version': '1.0.0'})
+        assert(header.filedesc.titlestmt == 'Doc')
+        assert(header.filedesc.title == 'Source')
+        assert(header.filedesc.extent == {'unit': 'word', 'count': '2'})
+        assert(header.filedesc.author == {'sex': 'f', 'name': 'Ann'})
+        assert(header.filedesc.pubDate == '2014-01-01')
+        assert(header.filedesc.idno == {'type': 'ISBN', 'number': '123'})
+        assert(header.profiledesc.languages == ['bal'])
+        assert(header.profiledesc.catRef == 'fiction')
+        assert(header.profiledesc.domain == 'narrative')
+        assert(header.profiledesc.participants == [{'id': 'p1', 'age': '30'}])
+        assert(header.profiledesc.settings == [{'who': 'p1', 'time': 'noon',
+                                                'activity': None, 'locale': 'home'}])
+        assert(header.primary_data_loc is None and header.annotations == [])
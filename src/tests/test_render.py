@@ -14,10 +14,17 @@ methods of the class GrafRenderer in io module.
 """
 
 import os
+import shutil
+import tempfile
 
 from xml.etree import ElementTree
 
-from graf import Annotation, Graph, GrafRenderer, Node, Region, Edge
+from graf import Annotation, Graph, GrafRenderer, Node, Region, Edge, \
+    StandoffHeader, StandoffHeaderParser, StandoffHeaderRenderer
+from graf.graphs import FileDesc, ProfileDesc, DataDesc
+from graf.io import GraphParser
+from graf.render import LayeredRenderer, render_graphs, render_layers, \
+    split_layers
 
 
 class TestGrafRenderer:
@@ -72,3 +79,368 @@ class TestGrafRenderer:
         assert (result[2] == expected_result[2])
         assert (result[3] == expected_result[3])
 
+    def test_render_edge_annotations(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'edges.xml')
+            node_a = Node('a')
+            node_b = Node('b')
+            self.graph.nodes.add(node_a)
+            self.graph.nodes.add(node_b)
+            node_a.annotations.add(Annotation('tok', {'pos': 'N'}, 'a-1'))
+            edge = self.graph.create_edge(node_a, node_b, 'e1')
+            edge.annotations.add(Annotation('dep', {'rel': 'subj'}, 'e1-1'))
+            edge.annotations.add(Annotation('tok', None, 'e1-2'))
+
+            GrafRenderer(filename).render(self.graph)
+
+            ns = '{http://www.xces.org/ns/GrAF/1.0/}'
+            root = ElementTree.parse(filename).getroot()
+            usage = dict((e.get('label'), e.get('occurs')) for e in
+                         root.iter(ns + 'labelUsage'))
+            assert usage == {'tok': '2', 'dep': '1'}
+
+            # Each edge is followed by its annotations
+            body = [(e.tag[len(ns):], e.get('ref') or e.get('from'))
+                    for e in root if e.tag != ns + 'graphHeader']
+            assert body == [('node', None), ('a', 'a'), ('node', None),
+                            ('edge', 'a'), ('a', 'e1'), ('a', 'e1')]
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_render_annotation_spaces(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'spaces.xml')
+            node = Node('n0')
+            self.graph.nodes.add(node)
+            words = self.graph.annotation_spaces.create('words')
+            tags = self.graph.annotation_spaces.create('tags')
+            for aspace, label, id in ((words, 'tok', 'a0'),
+                                      (tags, 'tok', 'a1')):
+                a = Annotation(label, None, id)
+                node.annotations.add(a)
+                aspace.add(a)
+
+            GrafRenderer(filename).render(self.graph)
+
+            # The annotations refer to their declared annotation space,
+            # not to their label, so the file can be parsed back
+            graph = GraphParser().parse(filename)
+            assert [a.id for a in graph.annotation_spaces['words']] == ['a0']
+            assert [a.id for a in graph.annotation_spaces['tags']] == ['a1']
+            assert 'tok' not in graph.annotation_spaces
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_render_non_ascii_attributes(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'unicode.xml')
+            node = Node(u'n\u00e9')
+            self.graph.nodes.add(node)
+            a = Annotation(u'ba\u00f1o', None, u'a\u0161')
+            node.annotations.add(a)
+            self.graph.annotation_spaces.create(u'gu\u0161').add(a)
+
+            GrafRenderer(filename).render(self.graph)
+
+            graph = GraphParser().parse(filename)
+            node = graph.nodes[u'n\u00e9']
+            a = list(node.annotations)[0]
+            assert a.label == u'ba\u00f1o'
+            assert a.id == u'a\u0161'
+            assert a.aspace.as_id == u'gu\u0161'
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_render_order(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'order.xml')
+            for id in ('n2', 'n10', 'n1'):
+                self.graph.nodes.add(Node(id))
+            for id, anchors in (('r1', (5, 8)), ('r2', (0, 3)),
+                                ('r3', (1, 2, 3))):
+                self.graph.regions.add(Region(id, *anchors))
+
+            def ids(order):
+                GrafRenderer(filename, order).render(self.graph)
+                root = ElementTree.parse(filename).getroot()
+                return [e.get('{http://www.w3.org/XML/1998/namespace}id')
+                        for e in root if not e.tag.endswith('graphHeader')]
+
+            assert ids(GrafRenderer.SORTED) == ['r2', 'r1', 'r3',
+                                                'n1', 'n10', 'n2']
+            assert ids(GrafRenderer.INSERTION) == ['r1', 'r2', 'r3',
+                                                   'n2', 'n10', 'n1']
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+
+class TestStandoffHeaderRenderer:
+    """
+    This class contains the test methods of the classes
+    StandoffHeaderRenderer and StandoffHeaderParser.
+
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'header.hdr')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        filedesc = FileDesc(titlestmt='Title', title='Title',
+                            author={'name': 'Someone', 'age': '30',
+                                    'sex': 'female'},
+                            extent={'count': '42', 'unit': 'word'},
+                            pubDate='2014-01-01')
+        profiledesc = ProfileDesc()
+        profiledesc.add_language('bal')
+        datadesc = DataDesc({'loc': 'text.txt', 'f.id': 'text',
+                             'loctype': 'relative'})
+        datadesc.add_annotation('text-word.xml', 'word')
+        header = StandoffHeader(filedesc=filedesc, profiledesc=profiledesc,
+                                datadesc=datadesc, doc_id='doc-1',
+                                creator='someone', date_created='2014-01-02')
+
+        StandoffHeaderRenderer(self.filename).render(header)
+        result = StandoffHeaderParser().parse(self.filename)
+
+        assert result.doc_id == 'doc-1'
+        assert result.creator == 'someone'
+        assert result.date_created == '2014-01-02'
+        assert result.version == '1.0.0'
+        assert result.filedesc.title == 'Title'
+        assert result.filedesc.author == {'name': 'Someone', 'age': '30',
+                                          'sex': 'female'}
+        assert result.filedesc.extent == {'count': '42', 'unit': 'word'}
+        assert result.filedesc.pubDate == '2014-01-01'
+        assert result.profiledesc.languages == ['bal']
+        assert result.datadesc.primaryData['loc'] == 'text.txt'
+        assert result.datadesc.annotations_list == [
+            {'loc': 'text-word.xml', 'loctype': 'relative', 'f.id': 'word'}]
+
+    def test_add_annotation(self):
+        filename = os.path.dirname(__file__) + '/sample_files/balochi.hdr'
+        header = StandoffHeaderParser().parse(filename)
+        header.datadesc.add_annotation('balochi-pos.xml', 'pos')
+
+        StandoffHeaderRenderer(self.filename).render(header)
+        result = StandoffHeaderParser().parse(self.filename)
+
+        assert result.doc_id == 'PoioAPI-26289'
+        assert result.creator == 'alopes'
+        assert result.filedesc.titlestmt == 'Pickle Example'
+        fids = [ann['f.id'] for ann in result.datadesc.annotations_list]
+        assert fids == ['utterance', 'clause_unit', 'word', 'wfw', 'graid1',
+                        'graid2', 'translation', 'comment', 'pos']
+        # The rendered header is well-formed and indented
+        root = ElementTree.parse(self.filename).getroot()
+        assert root.tag == '{http://www.xces.org/ns/GrAF/1.0/}documentHeader'
+
+
+class TestLayeredRendering:
+    """
+    This class contains the test methods of the parallel and layered
+    rendering functions of the render module.
+
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        filename = os.path.dirname(__file__) + '/sample_files/balochi.hdr'
+        self.graph = GraphParser().parse(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_split_layers(self):
+        layers = split_layers(self.graph)
+
+        assert [layer.name for layer in layers] == [
+            'utterance', 'clause_unit', 'word', 'wfw', 'graid1', 'graid2',
+            'translation', 'comment']
+        assert sum(len(layer.nodes) for layer in layers) == 1161
+        assert sum(len(layer.edges) for layer in layers) == 1050
+        # The layers depend on the same layers as the parsed files
+        word = layers[2]
+        assert word.depends_on == ['clause_unit']
+        assert len(word.nodes) == 396
+
+        merged = split_layers(self.graph, {'graid1': 'graid',
+                                           'graid2': 'graid'})
+        assert [layer.name for layer in merged] == [
+            'utterance', 'clause_unit', 'word', 'wfw', 'graid',
+            'translation', 'comment']
+        assert merged[4].depends_on == ['clause_unit', 'word']
+
+    def test_render_layers(self):
+        header_file = os.path.join(self.tmpdir, 'doc.hdr')
+
+        files = render_layers(self.graph, header_file, jobs=2)
+
+        assert files[2] == os.path.join(self.tmpdir, 'doc-word.xml')
+        graph = GraphParser().parse(header_file)
+        assert len(graph.nodes) == len(self.graph.nodes)
+        assert len(graph.edges) == len(self.graph.edges)
+        for aspace in self.graph.annotation_spaces:
+            parsed = graph.annotation_spaces[aspace.as_id]
+            assert [a.id for a in parsed] == [a.id for a in aspace]
+        a = next(iter(graph.annotation_spaces['word']))
+        assert a.features['annotation_value'] == u'gu\u0161-\u012bt:'
+
+    def test_render_layers_in_process(self):
+        import graf.render
+
+        files = render_layers(self.graph,
+                              os.path.join(self.tmpdir, 'doc.hdr'), jobs=2)
+        tmpdir = os.path.join(self.tmpdir, 'in-process')
+        os.mkdir(tmpdir)
+        header_file = os.path.join(tmpdir, 'doc.hdr')
+
+        # The layers are not kept in the module after the call
+        assert render_layers(self.graph, header_file, jobs=1) == [
+            os.path.join(tmpdir, os.path.basename(path)) for path in files]
+        assert graf.render._worker_layers is None
+        for path in files:
+            with open(path, 'rb') as expected:
+                with open(os.path.join(tmpdir, os.path.basename(path)),
+                          'rb') as result:
+                    assert result.read() == expected.read()
+
+    def test_render_graphs(self):
+        jobs = [(self.graph, os.path.join(self.tmpdir, 'graph%d.xml' % i))
+                for i in range(3)]
+
+        files = render_graphs(jobs, jobs=2)
+
+        assert sorted(files) == sorted(path for graph, path in jobs)
+        for path in files:
+            ns = '{http://www.xces.org/ns/GrAF/1.0/}'
+            root = ElementTree.parse(path).getroot()
+            assert len(root.findall(ns + 'node')) == 1161
+
+
+MASC_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<documentHeader xmlns="http://www.xces.org/ns/GrAF/1.0/" docId="doc-1"
+    version="1.0.0" creator="someone" date.created="2014-01-01">
+  <fileDesc>
+    <titleStmt><title>doc</title></titleStmt>
+    <sourceDesc/>
+  </fileDesc>
+  <profileDesc>
+    <primaryData loc="doc.txt" f.id="f.text"/>
+    <annotations>
+      <annotation loc="doc-seg.xml" f.id="f.seg"/>
+      <annotation loc="doc-penn.xml" f.id="f.penn"/>
+    </annotations>
+  </profileDesc>
+</documentHeader>
+"""
+
+MASC_SEG = """<?xml version="1.0" encoding="UTF-8"?>
+<graph xmlns="http://www.xces.org/ns/GrAF/1.0/">
+  <graphHeader>
+    <annotationSpaces>
+      <annotationSpace as.id="xces" default="true"/>
+    </annotationSpaces>
+  </graphHeader>
+  <region xml:id="seg-r0" anchors="0 5"/>
+  <region xml:id="seg-r1" anchors="6 11"/>
+  <node xml:id="seg-n0"><link targets="seg-r0"/></node>
+  <a label="tok" ref="seg-n0" xml:id="seg-a0"/>
+  <node xml:id="seg-n1"><link targets="seg-r1"/></node>
+  <a label="tok" ref="seg-n1" xml:id="seg-a1"/>
+</graph>
+"""
+
+MASC_PENN = """<?xml version="1.0" encoding="UTF-8"?>
+<graph xmlns="http://www.xces.org/ns/GrAF/1.0/">
+  <graphHeader>
+    <dependencies><dependsOn f.id="f.seg"/></dependencies>
+    <annotationSpaces><annotationSpace as.id="PTB"/></annotationSpaces>
+  </graphHeader>
+  <node xml:id="penn-n0"/>
+  <a label="NP" ref="penn-n0" as="PTB" xml:id="penn-a0">
+    <fs><f name="head"><fs type="word"><f name="base">hello</f></fs></f></fs>
+  </a>
+  <edge xml:id="penn-e0" from="penn-n0" to="seg-n0"/>
+  <edge xml:id="penn-e1" from="penn-n0" to="seg-n1"/>
+</graph>
+"""
+
+
+class TestLayeredRenderer:
+    """
+    This class contains the test methods of the class LayeredRenderer.
+
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.header_file = os.path.join(self.tmpdir, 'doc.hdr')
+        for name, content in (('doc.hdr', MASC_HEADER),
+                              ('doc-seg.xml', MASC_SEG),
+                              ('doc-penn.xml', MASC_PENN),
+                              ('doc.txt', 'hello world')):
+            with open(os.path.join(self.tmpdir, name), 'w') as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        graph = GraphParser().parse(self.header_file)
+        assert graph.header.layers == {'xces': 'f.seg', 'PTB': 'f.penn'}
+
+        written = LayeredRenderer(self.header_file).render(graph)
+
+        assert sorted(written) == sorted(
+            os.path.join(self.tmpdir, name) for name in
+            ('doc.hdr', 'doc-seg.xml', 'doc-penn.xml'))
+        assert sorted(os.listdir(self.tmpdir)) == [
+            'doc-penn.xml', 'doc-seg.xml', 'doc.hdr', 'doc.txt']
+
+        result = GraphParser().parse(self.header_file)
+        assert sorted(result.nodes.keys()) == sorted(graph.nodes.keys())
+        assert sorted(result.edges.keys()) == sorted(graph.edges.keys())
+        assert [a.id for a in result.annotation_spaces['xces']] == [
+            'seg-a0', 'seg-a1']
+        ann = next(iter(result.annotation_spaces['PTB']))
+        assert ann.element.id == 'penn-n0'
+        assert ann.features['head/base'] == 'hello'
+        assert ann.features['head'].type == 'word'
+        assert result.nodes['seg-n1'].links[0][0].anchors == [6, 11]
+        assert result.primary_data.text(0, 5) == 'hello'
+
+        header = StandoffHeaderParser().parse(self.header_file)
+        assert header.doc_id == 'doc-1'
+        assert [ann['f.id'] for ann in header.datadesc.annotations_list] == [
+            'f.seg', 'f.penn']
+
+    def test_render_changed(self):
+        graph = GraphParser().parse(self.header_file)
+        renderer = LayeredRenderer(self.header_file)
+        renderer.render(graph)
+
+        # Nothing changed
+        assert renderer.render(graph) == []
+
+        ann = next(iter(graph.annotation_spaces['PTB']))
+        ann.features['head/base'] = 'world'
+        seg = [a for a in graph.annotation_spaces['xces']][0]
+        seg.features['msd'] = 'X'
+        written = renderer.render(graph, changed=['PTB'])
+
+        assert written == [os.path.join(self.tmpdir, 'doc-penn.xml')]
+        result = GraphParser().parse(self.header_file)
+        ann = next(iter(result.annotation_spaces['PTB']))
+        assert ann.features['head/base'] == 'world'
+        # The other layer was not rewritten
+        seg = [a for a in result.annotation_spaces['xces']][0]
+        assert 'msd' not in seg.features
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# Poio Tools for Linguists
+#
+# Copyright (C) 2009-2012 Poio Project
+# Author: António Lopes <alopes@cidles.eu>
+# URL: <http://www.cidles.eu/ltll/poio>
+# For license information, see LICENSE.TXT
+"""This module contains the tests to the function
+validate_corpus.
+
+This test serves to ensure the viability of the
+corpus validation in validate module.
+"""
+
+import os
+import shutil
+import tempfile
+
+from graf.validate import validate_corpus
+
+class TestValidateCorpus:
+    """
+    This class contains the test methods of the function validate_corpus.
+
+    """
+
+    def test_validate_corpus(self):
+        dirname = os.path.dirname(__file__) + '/sample_files/'
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for filename in os.listdir(dirname):
+                if filename.startswith('balochi-'):
+                    shutil.copy(dirname + filename, tmpdir)
+            with open(os.path.join(tmpdir, 'broken-tok.xml'), 'w') as f:
+                f.write('<graph xmlns="http://www.xces.org/ns/GrAF/1.0/">\n'
+                        '<graphHeader><dependencies>'
+                        '<dependsOn f.id="seg"/></dependencies></graphHeader>\n'
+                        '<region xml:id="r1" anchors="0 1"/>\n'
+                        '<node xml:id="n1"><link targets="r1 r2"/></node>\n'
+                        '<edge xml:id="e1" from="n1" to="n2"/>\n'
+                        '<a label="tok" ref="e2" as="tok"/>\n'
+                        '</graph>\n')
+            with open(os.path.join(tmpdir, 'broken-seg.xml'), 'w') as f:
+                f.write('<graph xmlns="http://www.xces.org/ns/GrAF/1.0/">\n'
+                        '<node xml:id="n2"/>\n<node xml:id="n2"/>\n<graph>\n')
+
+            errors = validate_corpus([tmpdir], jobs=1, schema=False)
+            assert([(os.path.basename(e.file), e.line, e.error) for e in errors] == [
+                ('broken-seg.xml', 3, 'DuplicateId'),
+                ('broken-seg.xml', 5, 'SAXParseException'),
+                ('broken-tok.xml', 4, 'MissingRegion'),
+                ('broken-tok.xml', 6, 'UnknownReference'),
+            ])
+            assert(validate_corpus([tmpdir], jobs=2, schema=False) == errors)
+
+            os.remove(os.path.join(tmpdir, 'broken-seg.xml'))
+            errors = validate_corpus([os.path.join(tmpdir, 'broken-tok.xml')],
+                                     jobs=1, schema=False)
+            assert([(e.line, e.error) for e in errors] ==
+                   [(2, 'MissingDependency'), (4, 'MissingRegion'),
+                    (5, 'MissingNode'), (6, 'UnknownReference')])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_validate_corpus_header_locations(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            # The files of the layers are not named after the header, so
+            # their dependencies are only found through the header
+            os.mkdir(os.path.join(tmpdir, 'layers'))
+            with open(os.path.join(tmpdir, 'doc.hdr'), 'w') as f:
+                f.write('<documentHeader '
+                        'xmlns="http://www.xces.org/ns/GrAF/1.0/">\n'
+                        '<profileDesc><annotations>\n'
+                        '<annotation f.id="seg" loc="layers/segments.xml"/>\n'
+                        '<annotation f.id="word" loc="words.xml"/>\n'
+                        '</annotations></profileDesc>\n'
+                        '</documentHeader>\n')
+            with open(os.path.join(tmpdir, 'layers', 'segments.xml'),
+                      'w') as f:
+                f.write('<graph xmlns="http://www.xces.org/ns/GrAF/1.0/">\n'
+                        '<node xml:id="n1"/>\n</graph>\n')
+            with open(os.path.join(tmpdir, 'words.xml'), 'w') as f:
+                f.write('<graph xmlns="http://www.xces.org/ns/GrAF/1.0/">\n'
+                        '<graphHeader><dependencies>'
+                        '<dependsOn f.id="seg"/>'
+                        '<dependsOn f.id="tok"/></dependencies></graphHeader>\n'
+                        '<node xml:id="n2"/>\n'
+                        '<edge xml:id="e1" from="n1" to="n2"/>\n'
+                        '</graph>\n')
+
+            errors = validate_corpus([tmpdir], jobs=1, schema=False)
+            assert([(os.path.basename(e.file), e.line, e.error) for e in errors] ==
+                   [('words.xml', 2, 'MissingDependency')])
+            assert("'tok'" in errors[0].message)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_validate_corpus_schema(self):
+        try:
+            import lxml
+        except ImportError:
+            return
+
+        dirname = os.path.dirname(__file__) + '/sample_files/'
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for filename in os.listdir(dirname):
+                if filename.startswith('balochi'):
+                    shutil.copy(dirname + filename, tmpdir)
+
+            # The sample files are valid, but the header names a primary
+            # data file that is not shipped
+            errors = validate_corpus([tmpdir], jobs=1)
+            assert([(os.path.basename(e.file), e.error) for e in errors] ==
+                   [('balochi.hdr', 'MissingFile')])
+
+            with open(os.path.join(tmpdir, 'extra-tok.xml'), 'w') as f:
+                f.write('<graph xmlns="http://www.xces.org/ns/GrAF/1.0/">\n'
+                        '<node xml:id="n1"/>\n</graph>\n')
+            errors = validate_corpus([tmpdir], jobs=1)
+            assert([(os.path.basename(e.file), e.error) for e in errors] ==
+                   [('balochi.hdr', 'MissingFile'),
+                    ('extra-tok.xml', 'XMLSyntaxError')])
+            assert('graphHeader' in errors[1].message)
+            assert(validate_corpus([tmpdir], jobs=2) == errors)
+        finally:
+            shutil.rmtree(tmpdir)